@@ -14,6 +14,7 @@ from .const import *
 from .common import *
 from .config_flow import ConfigFlowHandler
 from .coordinator import  Coordinator
+from .discovery import async_start_listener
 from .entity import SolarmanConfigEntry, migrate_unique_ids
 
 _LOGGER = logging.getLogger(__name__)
@@ -25,8 +26,12 @@ CONFIG_SCHEMA = cv.empty_config_schema(DOMAIN)
 async def async_setup(hass: HomeAssistant, _: ConfigType) -> bool:
     _LOGGER.debug(f"async_setup")
 
+    set_yaml_cache(hass.config.path(LOOKUP_CACHE_DIRECTORY_PATH))
+
     async_register(hass)
 
+    async_start_listener(hass)
+
     return True
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: SolarmanConfigEntry) -> bool:
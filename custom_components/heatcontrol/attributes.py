@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import sys
+
+from typing import Any
+from types import MappingProxyType
+
+# Static entity attributes interned and shared by every entity with equal ones: frozen items -> [refs, mapping]
+_SHARED_ATTRIBUTES: dict[tuple, list] = {}
+
+EMPTY_ATTRIBUTES = MappingProxyType({})
+
+def freeze_value(value):
+    return tuple(freeze_value(v) for v in value) if isinstance(value, (list, tuple)) else sys.intern(value) if isinstance(value, str) else value
+
+def acquire_attributes(attributes: dict[str, Any]) -> MappingProxyType:
+    if not attributes:
+        return EMPTY_ATTRIBUTES
+    if (shared := _SHARED_ATTRIBUTES.get(key := tuple((sys.intern(k), freeze_value(v)) for k, v in attributes.items()))) is None:
+        shared = _SHARED_ATTRIBUTES[key] = [0, MappingProxyType(dict(key))]
+    shared[0] += 1
+    return shared[1]
+
+def release_attributes(attributes: MappingProxyType) -> None:
+    # The values are frozen already, so the items of a shared mapping are its key
+    if attributes and (shared := _SHARED_ATTRIBUTES.get(key := tuple(attributes.items()))) is not None and shared[1] is attributes:
+        if (refs := shared[0] - 1) > 0:
+            shared[0] = refs
+        else:
+            del _SHARED_ATTRIBUTES[key]
@@ -12,7 +12,7 @@ from homeassistant.components.binary_sensor import BinarySensorEntity, BinarySen
 from .const import *
 from .common import *
 from .services import *
-from .entity import SolarmanConfigEntry, create_entity, SolarmanEntity
+from .entity import SolarmanConfigEntry, create_entity, create_entities, SolarmanEntity
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -26,7 +26,7 @@ async def async_setup_entry(_: HomeAssistant, config_entry: SolarmanConfigEntry,
 
     _LOGGER.debug(f"async_setup_entry: async_add_entities: {descriptions}")
 
-    async_add_entities(create_entity(lambda x: SolarmanBinarySensorEntity(coordinator, x), d) for d in descriptions)
+    async_add_entities(create_entities(coordinator, _PLATFORM, lambda x: SolarmanBinarySensorEntity(coordinator, x), descriptions))
 
     async_add_entities([create_entity(lambda _: SolarmanConnectionSensor(coordinator), None)])
 
@@ -53,6 +53,8 @@ class SolarmanConnectionSensor(SolarmanBinarySensorEntity):
         super().__init__(coordinator, {"key": "connection_binary_sensor", "name": "Connection"})
         self._attr_device_class = BinarySensorDeviceClass.CONNECTIVITY 
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._dependencies = None
+        self.coordinator_context = None
 
     @property
     def available(self) -> bool:
@@ -65,4 +67,14 @@ class SolarmanConnectionSensor(SolarmanBinarySensorEntity):
     def update(self):
         self.set_state(self.coordinator.device.state.value)
         self._attr_extra_state_attributes["updated"] = self.coordinator.device.state.updated.strftime("%m/%d/%Y, %H:%M:%S")
+        self._attr_extra_state_attributes["writes"] = self.coordinator.counters["writes"]
+        self._attr_extra_state_attributes["skipped_writes"] = self.coordinator.counters["skipped_writes"]
+        if (scheduler := self.coordinator.scheduler) is not None:
+            self._attr_extra_state_attributes["max_slip"] = round(scheduler.max_slip, 3)
+        # Kept until the sensor platform adds the diagnostic sensors of the instrumentation
+        if (metrics := self.coordinator.metrics).enabled:
+            for stage, histogram in metrics.stages.items():
+                for k, v in histogram.as_dict().items():
+                    self._attr_extra_state_attributes[f"{stage}_{k}"] = v
+            self._attr_extra_state_attributes.update(metrics.counters)
         # Maybe set the timestamp using HA's datetime format???
@@ -2,7 +2,11 @@ from __future__ import annotations
 
 import os
 import re
+import sys
 import yaml
+import pickle
+import bisect
+import hashlib
 import logging
 import asyncio
 import aiofiles
@@ -10,9 +14,11 @@ import aiofiles
 import voluptuous as vol
 
 from typing import Any
+from contextvars import ContextVar
 
 from homeassistant.util import slugify
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.device_registry import CONNECTION_NETWORK_MAC, DeviceInfo, format_mac
 
 from .const import *
@@ -70,19 +76,103 @@ def ensure_list_safe_len(value: list):
 def set_request(code, start, end):
     return { REQUEST_CODE: code, REQUEST_START: start, REQUEST_END: end }
 
+# Set by the coordinator around the device's load: (hass, serial, deferred revalidations), autodetection is then cached per serial
+AUTODETECTION_CONTEXT: ContextVar[tuple | None] = ContextVar("autodetection", default = None)
+
 async def lookup_profile(request, attr):
-    if (response := await request(-1, set_request(*AUTODETECTION_REQUEST_DEYE))) and (device_type := get_addr_value(response, *AUTODETECTION_DEVICE_DEYE)):
+    if (context := AUTODETECTION_CONTEXT.get()) is not None:
+        return await lookup_profile_cached(*context[:2], request, attr, context[2])
+    return await detect_profile(request, attr)
+
+async def detect_profile(request, attr):
+    if (response := RegisterMap(await request(-1, set_request(*AUTODETECTION_REQUEST_DEYE)) or {})) and (device_type := get_addr_value(response, *AUTODETECTION_DEVICE_DEYE)):
         f, m, c = next(iter([AUTODETECTION_DEYE[i] for i in AUTODETECTION_DEYE if device_type in i]))
         if (t := get_addr_value(response, *AUTODETECTION_TYPE_DEYE)) and device_type in (0x0003, 0x0300):
             attr[ATTR_[CONF_PHASE]] = min(1 if t <= 2 or t == 8 else 3, attr[ATTR_[CONF_PHASE]])
         if (v := get_addr_value(response, AUTODETECTION_CODE_DEYE, c)) and (t := (v & 0x0F00) // 0x100) and (p := v & 0x000F) and (t := 2 if t > 12 else t) and (p := 3 if p > 3 else p):
             attr[ATTR_[CONF_MOD]], attr[ATTR_[CONF_MPPT]], attr[ATTR_[CONF_PHASE]] = max(m, attr[ATTR_[CONF_MOD]]), min(t, attr[ATTR_[CONF_MPPT]]), min(p, attr[ATTR_[CONF_PHASE]])
-        if device_type in (0x0005, 0x0500, 0x0006, 0x0007, 0x0600, 0x0008, 0x0601) and (response := await request(-1, set_request(0x0003, 0x2712, 0x2712))) and (p := get_addr_value(response, 0x0003, 0x2712)) is not None:
+        if device_type in (0x0005, 0x0500, 0x0006, 0x0007, 0x0600, 0x0008, 0x0601) and (response := RegisterMap(await request(-1, set_request(0x0003, 0x2712, 0x2712)) or {})) and (p := get_addr_value(response, 0x0003, 0x2712)) is not None:
             attr[ATTR_[CONF_PACK]] = p if attr[ATTR_[CONF_PACK]] == DEFAULT_[CONF_PACK] else min(p, attr[ATTR_[CONF_PACK]])
         return f
     raise Exception("Unable to read Device Type at address 0x0000")
 
+async def lookup_profile_cached(hass: HomeAssistant, serial, request, attr, revalidations: list | None = None):
+    store = Store(hass, AUTODETECTION_STORAGE_VERSION, f"{AUTODETECTION_STORAGE_KEY}.{serial}")
+    requested = dict(attr)
+
+    async def detect():
+        detected = dict(requested)
+        f = await detect_profile(request, detected)
+        await store.async_save({ "requested": requested, "filename": f, "attr": detected })
+        return f, detected
+
+    async def revalidate():
+        try:
+            if (result := await detect()) != (cached["filename"], cached["attr"]):
+                _LOGGER.info(f"lookup_profile_cached: Detected {result} differs from cached {cached['filename']}, {cached['attr']}, used on next setup")
+        except Exception as e:
+            _LOGGER.debug(f"lookup_profile_cached: Revalidation failed: {format_exception(e)}")
+
+    if (cached := await store.async_load()) and cached.get("requested") == requested:
+        attr.update(cached["attr"])
+        # Deferred revalidations are started by the caller, e.g. once the first refresh is done
+        if revalidations is not None:
+            revalidations.append(revalidate)
+        else:
+            hass.async_create_background_task(revalidate(), f"{DOMAIN} {serial} autodetection")
+        return cached["filename"]
+
+    f, detected = await detect()
+    attr.update(detected)
+    return f
+
+# Directory the parsed profiles are pickled to, set on setup, every yaml_open (including the device's parser) reads through it
+_YAML_CACHE: str | None = None
+
+def set_yaml_cache(directory: str | None) -> None:
+    global _YAML_CACHE
+    _YAML_CACHE = directory
+
+def pickle_load(path: str, stamp: tuple) -> Any:
+    try:
+        with open(path, "rb") as f:
+            if (cached := pickle.load(f)) and cached[0] == stamp:
+                return cached[1]
+        _LOGGER.debug(f"pickle_load: {path} is stale")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        _LOGGER.debug(f"pickle_load: {path} is unreadable. [{format_exception(e)}]")
+    return None
+
+def pickle_dump(path: str, stamp: tuple, value: Any) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(temp := f"{path}.{os.getpid()}.tmp", "wb") as f:
+            pickle.dump((stamp, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, path)
+    except Exception as e:
+        _LOGGER.debug(f"pickle_dump: {path} is not writable. [{format_exception(e)}]")
+
+def yaml_load(file: str, cache: str | None = None) -> Any:
+    stat = os.stat(file)
+    stamp = (LOOKUP_CACHE_VERSION, sys.version_info[:2], file := os.path.abspath(file), stat.st_mtime_ns, stat.st_size)
+    path = os.path.join(cache, f"{os.path.basename(file)}.{hashlib.sha1(file.encode()).hexdigest()[:16]}.yaml.pickle") if cache else None
+
+    if path and (cached := pickle_load(path, stamp)) is not None:
+        return cached
+
+    with open(file) as f:
+        profile = yaml.safe_load(f)
+
+    if path:
+        pickle_dump(path, stamp, profile)
+
+    return profile
+
 async def yaml_open(file):
+    if _YAML_CACHE is not None:
+        return await async_execute(lambda: yaml_load(file, _YAML_CACHE))
     async with aiofiles.open(file) as f:
         return yaml.safe_load(await f.read())
 
@@ -127,6 +217,28 @@ def group_when(iterable, predicate):
         i += 1
     yield iterable[x:size]
 
+def group_registers(registers, code = None, min_span = DEFAULT_[REGISTERS_MIN_SPAN], max_size = DEFAULT_[REGISTERS_MAX_SIZE]):
+    l = (lambda x, y: y - x > min_span) if min_span > -1 else (lambda x, y: False)
+    _lambda = lambda x, y, z: l(x[1], y[1]) or y[1] - z[1] >= max_size
+    _lambda_code_aware = lambda x, y, z: x[0] != y[0] or _lambda(x, y, z)
+    return [set_request(code if code is not None else r[0][0], r[0][1], r[-1][1]) for r in group_when(registers, _lambda if code is not None or all_same([r[0] for r in registers]) else _lambda_code_aware) if len(r) > 0]
+
+def group_registers_by_cost(registers, overhead, per_register, code = None, max_size = DEFAULT_[REGISTERS_MAX_SIZE]):
+    # Partitions the sorted registers into requests minimizing sum(overhead + per_register * len)
+    size = len(registers)
+    best, split = [0.0] + [float("inf")] * size, [0] * (size + 1)
+    for j in range(1, size + 1):
+        i = j
+        while i > 0 and registers[i - 1][0] == registers[j - 1][0] and registers[j - 1][1] - registers[i - 1][1] < max_size:
+            if (c := best[i - 1] + overhead + per_register * (registers[j - 1][1] - registers[i - 1][1] + 1)) < best[j]:
+                best[j], split[j] = c, i - 1
+            i -= 1
+    groups, j = [], size
+    while j > 0:
+        groups.insert(0, registers[split[j]:j])
+        j = split[j]
+    return [set_request(code if code is not None else r[0][0], r[0][1], r[-1][1]) for r in groups]
+
 def format_exception(e):
     return re.sub(r"\s+", " ", f"{type(e).__name__}{f': {e}' if f'{e}' else ''}")
 
@@ -173,16 +285,91 @@ def get_code(item, type, default = None):
             return code[type]
     return default
 
+class RegisterMap(dict):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._index = None
+        self._values = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._index = self._values = None
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._index = self._values = None
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._index = self._values = None
+
+    def clear(self):
+        super().clear()
+        self._index = self._values = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {}
+            for code, start in sorted(self.keys()):
+                starts, ends, keys = self._index.setdefault(code, ([], [], []))
+                starts.append(start)
+                ends.append(start + len(self[(code, start)]))
+                keys.append((code, start))
+        return self._index
+
+    @property
+    def values_by_code(self):
+        if self._values is None:
+            self._values = {}
+            # Same precedence as the linear scan: first block covering the address wins
+            for (code, start), block in reversed(self.items()):
+                self._values.setdefault(code, {}).update(zip(range(start, start + len(block)), block))
+        return self._values
+
+    def get_start_addr(self, code, addr):
+        if (i := self.index.get(code)) is None or (p := bisect.bisect_right(i[0], addr) - 1) < 0:
+            return None
+        # Blocks may overlap, the nearest start does not have to be the one covering addr
+        while p > -1:
+            if addr < i[1][p]:
+                return i[2][p]
+            p -= 1
+        return None
+
+    def get_addr_value(self, code, addr):
+        if (values := self.values_by_code.get(code)) is None:
+            return None
+        return values.get(addr)
+
+# Responses built as plain dicts (the device's poll) are wrapped once per poll: [responses, blocks, register map]
+# Responses with fewer blocks than REGISTER_MAP_MIN_BLOCKS are scanned, indexing them costs more than it saves
+REGISTER_MAP_MIN_BLOCKS = 8
+_REGISTER_MAP: list = [None, 0, None]
+
+def register_map(data):
+    if isinstance(data, RegisterMap):
+        return data
+    # The responses are held until the next poll's, so a new poll can't reuse their id
+    if _REGISTER_MAP[0] is not data or _REGISTER_MAP[1] != len(data):
+        _REGISTER_MAP[:] = data, len(data), RegisterMap(data)
+    return _REGISTER_MAP[2]
+
 def get_start_addr(data, code, addr):
+    if isinstance(data, RegisterMap) or len(data) >= REGISTER_MAP_MIN_BLOCKS:
+        return register_map(data).get_start_addr(code, addr)
     for d in data:
         if d[0] == code and d[1] <= addr < d[1] + len(data[d]):
             return d
     return None
 
 def get_addr_value(data, code, addr):
-    if (start := get_start_addr(data, code, addr)) is None:
-        return None
-    return data[start][addr - start[1]]
+    if isinstance(data, RegisterMap) or len(data) >= REGISTER_MAP_MIN_BLOCKS:
+        return register_map(data).get_addr_value(code, addr)
+    for (c, start), block in data.items():
+        if c == code and start <= addr < start + len(block):
+            return block[addr - start]
+    return None
 
 def ilen(object):
     return len(object) if not isinstance(object, int) else 1
@@ -198,7 +385,7 @@ def from_bit_index(value):
         return sum(1 << i for i in value)
     return 1 << value
 
-def lookup_value(value, dictionary):
+def lookup_linear(value, dictionary):
     default = dictionary[0]["value"]
 
     for o in dictionary:
@@ -215,6 +402,50 @@ def lookup_value(value, dictionary):
 
     return default
 
+def compile_lookup(dictionary):
+    table, masks, default = {}, [], dictionary[0]["value"]
+
+    for n, o in enumerate(dictionary):
+        key = from_bit_index(o["bit"]) if "bit" in o else o["key"]
+
+        if o.get("mode") == "single":
+            masks.append((n, key, o["value"]))
+
+        if "default" in o or key == "default":
+            default = o["value"]
+
+        for k in key if isinstance(key, list) else (key,):
+            table.setdefault(k, (n, o["value"]))
+
+    return table, tuple(masks), default
+
+def lookup_compiled(value, compiled):
+    table, masks, default = compiled
+
+    try:
+        match = table.get(value)
+    except TypeError:
+        match = None
+
+    # First matching entry wins, "single" entries are checked only if they precede the exact match
+    for n, key, v in masks:
+        if match is not None and n >= match[0]:
+            break
+        if value & key == key:
+            return v
+
+    return match[1] if match is not None else default
+
+# Compiled lookups of the lookup lists seen: id -> (list, compiled), the list is kept so its id is not reused
+_LOOKUPS: dict[int, tuple] = {}
+
+def lookup_value(value, dictionary):
+    if (entry := _LOOKUPS.get(id(dictionary))) is None or entry[0] is not dictionary:
+        if len(_LOOKUPS) >= LOOKUP_COMPILED_SIZE:
+            _LOOKUPS.clear()
+        entry = _LOOKUPS[id(dictionary)] = (dictionary, compile_lookup(dictionary))
+    return lookup_compiled(value, entry[1])
+
 def get_number(value, digits: int = -1):
     return int(value) if isinstance(value, int) or (isinstance(value, float) and value.is_integer()) else ((n if (n := round(value, digits)) and not n.is_integer() else int(n)) if digits > -1 else float(value))
 
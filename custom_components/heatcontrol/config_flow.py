@@ -36,7 +36,8 @@ OPTS_SCHEMA = {
                 vol.Optional(CONF_PACK, default = DEFAULT_[CONF_PACK], description = {SUGGESTED_VALUE: DEFAULT_[CONF_PACK]}): vol.All(vol.Coerce(int), vol.Range(min = -1, max = 8)),
                 vol.Optional(CONF_BATTERY_NOMINAL_VOLTAGE, default = DEFAULT_[CONF_BATTERY_NOMINAL_VOLTAGE], description = {SUGGESTED_VALUE: DEFAULT_[CONF_BATTERY_NOMINAL_VOLTAGE]}): cv.positive_int,
                 vol.Optional(CONF_BATTERY_LIFE_CYCLE_RATING, default = DEFAULT_[CONF_BATTERY_LIFE_CYCLE_RATING], description = {SUGGESTED_VALUE: DEFAULT_[CONF_BATTERY_LIFE_CYCLE_RATING]}): cv.positive_int,
-                vol.Optional(CONF_MB_SLAVE_ID, default = DEFAULT_[CONF_MB_SLAVE_ID], description = {SUGGESTED_VALUE: DEFAULT_[CONF_MB_SLAVE_ID]}): cv.positive_int
+                vol.Optional(CONF_MB_SLAVE_ID, default = DEFAULT_[CONF_MB_SLAVE_ID], description = {SUGGESTED_VALUE: DEFAULT_[CONF_MB_SLAVE_ID]}): cv.positive_int,
+                vol.Optional(CONF_INSTRUMENTATION, default = DEFAULT_[CONF_INSTRUMENTATION], description = {SUGGESTED_VALUE: DEFAULT_[CONF_INSTRUMENTATION]}): bool
             }
         ),
         {"collapsed": True}
@@ -91,7 +92,7 @@ class ConfigFlowHandler(ConfigFlow, domain = DOMAIN):
             name = None
             serial = None
             ip = None
-            if (discovered := await Discovery(self.hass).discover()):
+            if (discovered := await Discovery(self.hass).discover(cached = True)):
                 for s in discovered:
                     try:
                         self._async_abort_entries_match({ CONF_SERIAL: s })
@@ -11,11 +11,19 @@ DISCOVERY_PORT = 48899
 DISCOVERY_TIMEOUT = .5
 DISCOVERY_MESSAGE = ["WIFIKIT-214028-READ".encode(), "HF-A11ASSISTHREAD".encode()]
 
+# Discovered loggers are cached for DISCOVERY_CACHE_TTL seconds and the passive listener re-broadcasts every DISCOVERY_INTERVAL seconds
+DISCOVERY_CACHE_TTL = 900
+DISCOVERY_INTERVAL = 300
+
 COMPONENTS_DIRECTORY = "custom_components"
 
 LOOKUP_DIRECTORY = "inverter_definitions"
 LOOKUP_DIRECTORY_PATH = f"{COMPONENTS_DIRECTORY}/{DOMAIN}/{LOOKUP_DIRECTORY}/"
 LOOKUP_CUSTOM_DIRECTORY_PATH = f"{COMPONENTS_DIRECTORY}/{DOMAIN}/{LOOKUP_DIRECTORY}/custom/"
+LOOKUP_CACHE_DIRECTORY_PATH = f".storage/{DOMAIN}/{LOOKUP_DIRECTORY}/"
+LOOKUP_CACHE_VERSION = 7
+# Lookup tables compiled on first use are kept for at most this many lookup lists
+LOOKUP_COMPILED_SIZE = 4096
 
 CONF_SERIAL = "serial"
 CONF_HOST = "host"
@@ -29,6 +37,7 @@ CONF_PACK = "pack"
 CONF_BATTERY_NOMINAL_VOLTAGE = "battery_nominal_voltage"
 CONF_BATTERY_LIFE_CYCLE_RATING = "battery_life_cycle_rating"
 CONF_MB_SLAVE_ID = "mb_slave_id"
+CONF_INSTRUMENTATION = "instrumentation"
 
 OLD_ = { CONF_SERIAL: "inverter_serial", CONF_HOST: "inverter_host", CONF_PORT: "inverter_port" }
 
@@ -45,6 +54,7 @@ DEFAULT_ = {
     CONF_HOST: "",
     CONF_PORT: 8899, 
     CONF_MB_SLAVE_ID: 1,
+    CONF_INSTRUMENTATION: False,
     CONF_LOOKUP_FILE: "Auto",
     CONF_MOD: False,
     CONF_MPPT: 4,
@@ -61,6 +71,9 @@ DEFAULT_ = {
 }
 
 AUTODETECTION_REDIRECT = [DEFAULT_[CONF_LOOKUP_FILE], "deye_string.yaml", "deye_p1.yaml", "deye_hybrid.yaml", "deye_micro.yaml", "deye_4mppt.yaml", "deye_2mppt.yaml", "deye_p3.yaml", "deye_sg04lp3.yaml", "deye_sg01hp3.yaml"]
+# Detected profile and attributes are stored per serial, used right away on setup and revalidated in the background
+AUTODETECTION_STORAGE_VERSION = 1
+AUTODETECTION_STORAGE_KEY = f"{DOMAIN}.autodetection"
 AUTODETECTION_CODE_DEYE = 0x03
 AUTODETECTION_REQUEST_DEYE = (AUTODETECTION_CODE_DEYE, 0x00, 0x16)
 AUTODETECTION_DEVICE_DEYE = (AUTODETECTION_CODE_DEYE, 0x00)
@@ -90,9 +103,49 @@ TIMINGS_UPDATE_INTERVAL = td(seconds = TIMINGS_INTERVAL * TIMINGS_INTERVAL_SCALE
 TIMINGS_UPDATE_TIMEOUT = TIMINGS_INTERVAL * 4
 TIMINGS_TIMEOUT = TIMINGS_INTERVAL * 3 - 1
 
+# Realtime items are polled separately at this interval (seconds), can be set in profile's default
+TIMINGS_REALTIME_INTERVAL = .5
+# After this many failed reads in a row the regular poll reads the realtime items until the fast lane succeeds again
+TIMINGS_REALTIME_FAILURES = 3
+
+# Unreferenced shared profiles are dropped after this delay (seconds), an entry reloaded within it reuses the profile
+TIMINGS_PROFILE_RELEASE = 60
+
+# Adaptive request planning
+# Round-trip times are averaged per request size over a sliding window and the planner
+# switches from the default min span only when enough samples of different sizes were seen
+TIMINGS_SAMPLES_WINDOW = 50
+TIMINGS_SAMPLES_MIN = 20
+TIMINGS_STORAGE_VERSION = 1
+TIMINGS_STORAGE_KEY = f"{DOMAIN}.timings"
+TIMINGS_STORAGE_DELAY = 600
+# Request plans are rebuilt with the learned timings at most this often (seconds)
+TIMINGS_REPLAN_INTERVAL = 3600
+
+# Writes issued within this window (seconds) are coalesced into multiple register frames of up to WRITE_MAX_SIZE registers
+TIMINGS_WRITE_WINDOW = .05
+WRITE_MAX_SIZE = 123
+
+# Re-read the written registers right after a write, can be set in profile's default or per item as "verify"
+WRITE_VERIFY = False
+
 # Constants also tied to TIMINGS_INTERVAL to ensure maximum synergy
 ACTION_ATTEMPTS = 5
 
+# Instrumentation keeps percentiles over this many latest samples per stage
+METRICS_SAMPLES = 1000
+
+# Transport
+# Requests are pipelined up to TRANSPORT_PIPELINE per connection and pipelining is turned off
+# for the connection on the first timeout as some loggers silently drop queued frames
+TRANSPORT_PIPELINE = 4
+TRANSPORT_ATTEMPTS = 2
+TRANSPORT_TIMEOUT = TIMINGS_INTERVAL
+TRANSPORT_CONNECT_TIMEOUT = TIMINGS_INTERVAL
+TRANSPORT_IDLE_TIMEOUT = TIMINGS_INTERVAL * 12
+TRANSPORT_BACKOFF_MIN = 1
+TRANSPORT_BACKOFF_MAX = TIMINGS_INTERVAL * 12
+
 REQUEST_UPDATE_INTERVAL = UPDATE_INTERVAL
 REQUEST_MIN_SPAN = "min_span"
 REQUEST_MAX_SIZE = "max_size"
@@ -100,6 +153,8 @@ REQUEST_CODE = "code"
 REQUEST_CODE_ALT = "mb_functioncode"
 REQUEST_START = "start"
 REQUEST_END = "end"
+REQUEST_REALTIME = "realtime"
+REQUEST_REALTIME_INTERVAL = "realtime_interval"
 
 SERVICES_PARAM_DEVICE = "device"
 SERVICES_PARAM_ADDRESS = "address"
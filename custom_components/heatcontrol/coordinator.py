@@ -1,14 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 
+from time import monotonic
 from typing import Any
+from types import MappingProxyType
 
-from homeassistant.core import HomeAssistant
+from homeassistant.util import slugify
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
 from .const import *
+from .common import *
 from .device import Device
+from .metrics import Metrics
+from .writes import WriteQueue
+from .timings import RequestTimings
+from .scheduler import Scheduler
+from .transport import acquire_connection, release_connection
+from .discovery import resolver
+from .pysolarman.pysolarman import FUNCTION_CODE
+from .profile import async_acquire_profile, release_profile, replan_schedule
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -17,28 +32,264 @@ class Coordinator(DataUpdateCoordinator[dict[str, Any]]):
         super().__init__(hass, _LOGGER, name = device.config.name, update_interval = TIMINGS_UPDATE_INTERVAL, always_update = False)
         self.device = device
         self._counter = 0
+        self._values: dict[str, Any] = {}
+        self.changed: set[str] | None = None
+        self.counters = { "writes": 0, "skipped_writes": 0 }
+        self.disabled: set[str] = set()
+        self._index: tuple[dict[str, list[CALLBACK_TYPE]], list[CALLBACK_TYPE]] | None = None
+        self._dispatched: tuple | None = None
+        self.timings = RequestTimings()
+        self.profile = None
+        self.scheduler: Scheduler | None = None
+        # Serializes the regular poll, the fast lane and the reads back, the fast lane skips its turn while it is held
+        self._lock = asyncio.Lock()
+        self._realtime: asyncio.Task | None = None
+        self._realtime_requests: list[dict] = []
+        self._realtime_failures = 0
+        self._revalidations: list = []
+        self._excluded: set[str] | None = None
+        self._model: tuple[float, float] | None = None
+        self._replanned = 0.0
+        self._timings_saving = False
+        self._connection = None
+        self._replan: asyncio.Handle | None = None
+        self._unsub_registry: CALLBACK_TYPE | None = None
+        self.writes = WriteQueue(device.exe, FUNCTION_CODE.WRITE_MULTIPLE_REGISTERS)
+        self.metrics = Metrics(bool((self.config_entry.options.get(CONF_ADDITIONAL_OPTIONS) or {}).get(CONF_INSTRUMENTATION, DEFAULT_[CONF_INSTRUMENTATION])) if self.config_entry else False)
+        self._timings_store = Store(hass, TIMINGS_STORAGE_VERSION, f"{TIMINGS_STORAGE_KEY}.{device.config.serial}")
+
+    @property
+    def index(self) -> tuple[dict[str, list[CALLBACK_TYPE]], list[CALLBACK_TYPE]]:
+        # Listener contexts are the data keys an entity depends on, listeners without context get every update
+        if self._index is None:
+            self._index = ({}, [])
+            for update_callback, context in self._listeners.values():
+                if context is None:
+                    self._index[1].append(update_callback)
+                    continue
+                for key in context:
+                    self._index[0].setdefault(key, []).append(update_callback)
+        return self._index
+
+    @property
+    def items(self) -> tuple[MappingProxyType, ...]:
+        # Descriptions of the shared profile, frozen and built once per profile and attributes
+        return self.profile["items"] if self.profile is not None else ()
+
+    @callback
+    def async_add_listener(self, update_callback: CALLBACK_TYPE, context: Any = None) -> CALLBACK_TYPE:
+        remove_listener = super().async_add_listener(update_callback, context)
+        self._index = None
+
+        @callback
+        def remove_dispatch_listener() -> None:
+            remove_listener()
+            self._index = None
+
+        return remove_dispatch_listener
+
+    @callback
+    def async_update_listeners(self) -> None:
+        start = self.metrics.start()
+        dispatched, self._dispatched = self._dispatched, (self.last_update_success, self.device.state.value)
+        if (changed := self.changed) is None or dispatched != self._dispatched:
+            super().async_update_listeners()
+        else:
+            index, broadcast = self.index
+            for update_callback in dict.fromkeys([*broadcast, *(c for k in changed if k in index for c in index[k])]):
+                update_callback()
+        self.metrics.stop("dispatch", start)
 
     async def _async_setup(self) -> None:
         try:
-            return await self.device.load()
+            if (samples := await self._timings_store.async_load()):
+                self.timings = RequestTimings(samples)
+            # Autodetection of the device's profile is cached, its revalidation waits for the first refresh
+            context = AUTODETECTION_CONTEXT.set((self.hass, self.device.config.serial, self._revalidations))
+            try:
+                result = await self.device.load()
+            finally:
+                AUTODETECTION_CONTEXT.reset(context)
+            config = self.device.config
+            try:
+                # Entries of the slaves behind one logger register with its shared connection
+                connection = self._connection = acquire_connection(config.host, config.port, config.serial, resolve = resolver(self.hass))
+            except Exception as e:
+                _LOGGER.debug(f"_async_setup: {format_exception(e)}")
+                connection = None
+            if connection is not None:
+                # Slaves on the same logger share its timings
+                if connection.timings is None:
+                    connection.timings = self.timings
+                else:
+                    self.timings = connection.timings
+                # Transport stages are counted once per logger, by the first instrumented slave
+                if self.metrics.enabled and not connection.metrics.enabled:
+                    connection.metrics = self.metrics
+            self.profile = await async_acquire_profile(self.hass, self.device.config.directory + self.device.profile.filename, self.device.profile.attributes)
+            self.async_replan()
+            self._unsub_registry = self.hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, self._async_registry_updated)
+            if self.profile[REQUEST_REALTIME]:
+                self._realtime = self.hass.async_create_background_task(self._async_realtime(self.profile[REQUEST_REALTIME_INTERVAL]), f"{DOMAIN} {self.name} realtime")
+            return result
         except Exception as e:
             if isinstance(e, TimeoutError):
                 raise
             raise UpdateFailed(e) from e
 
+    def unique_keys(self) -> dict[str, str]:
+        # Unique id -> item key, items with a name lookup are registered under the key of the last looked up name
+        config = self.device.config
+        keys = {}
+        for i in self.items:
+            key = i["key"]
+            if (nlookup := i.get("name_lookup")) is not None and (prefix := self._values.get(nlookup)) is not None:
+                key = entity_key(i | { "name": replace_first(i["name"], get_tuple(prefix)) })
+            keys[slugify('_'.join(filter(None, (config.name, str(config.serial), key))))] = i["key"]
+        return keys
+
+    def excluded(self) -> set[str]:
+        keys = self.unique_keys()
+        disabled = self.disabled | {k for e in er.async_entries_for_config_entry(er.async_get(self.hass), self.config_entry.entry_id) if e.disabled and (k := keys.get(e.unique_id))}
+        # Keys read by enabled entities as attributes or name lookups are polled anyway
+        needed = {k for i in self.items if not i["key"] in disabled for k in (*(slugify('_'.join((a, "sensor"))) for a in i.get("attributes") or ()), i.get("name_lookup")) if k}
+        return disabled - needed
+
+    @callback
+    def async_replan(self) -> None:
+        # Only registers backing enabled entities are polled
+        self._replan = None
+        self._replanned = monotonic()
+        if self.profile is None or ((excluded := self.excluded()), (model := self.timings.model())) == (self._excluded, self._model):
+            return
+        schedule, self._realtime_requests = replan_schedule(self.profile, self.items, excluded, self.timings)
+        if self.scheduler is None:
+            self.scheduler = Scheduler(schedule, self._update_interval_seconds, monotonic())
+        else:
+            self.scheduler.replace(schedule, monotonic())
+        self._excluded, self._model = excluded, model
+        _LOGGER.debug(f"async_replan: {len(excluded)} keys excluded, timings model {model}, {sum(len(r) for r in schedule.values())} scheduled and {len(self._realtime_requests)} realtime requests")
+
+    @callback
+    def _async_registry_updated(self, event: Event[er.EventEntityRegistryUpdatedData]) -> None:
+        if self._replan is not None or event.data["action"] == "remove" or (event.data["action"] == "update" and not "disabled_by" in event.data["changes"]):
+            return
+        if (entry := er.async_get(self.hass).async_get(event.data["entity_id"])) is not None and entry.config_entry_id == self.config_entry.entry_id:
+            # Batches registry changes made at once (e.g. during platform setup) into a single replan
+            self._replan = self.hass.loop.call_soon(self.async_replan)
+
+    async def _async_realtime(self, interval: float) -> None:
+        # Fast lane yields to the regular poll and pushes values to the realtime entities only
+        while True:
+            # A failing fast lane is only retried once per update, the regular poll reads its requests meanwhile
+            await asyncio.sleep(interval if self._realtime_failures < TIMINGS_REALTIME_FAILURES else self._update_interval_seconds)
+            if self._lock.locked() or not self.last_update_success or self.data is None or not (requests := self._realtime_requests):
+                continue
+            async with self._lock:
+                start, started = self.metrics.start(), monotonic()
+                try:
+                    data = await self.device.get(int(self._counter * self._update_interval_seconds), requests)
+                    self._record_timings(requests, monotonic() - started)
+                except Exception as e:
+                    _LOGGER.debug(f"_async_realtime: {format_exception(e)}")
+                    self.metrics.count("failed_realtime_polls")
+                    self._realtime_failures += 1
+                    continue
+                self.metrics.stop("realtime_poll", start)
+            self._realtime_failures = 0
+            self.async_push(data)
+
+    @callback
+    def async_push(self, data: dict[str, Any], changed: set[str] | None = None) -> None:
+        # Merges data read outside of the regular poll and dispatches it to the dependent entities
+        if (changed := changed if changed is not None else {k for k, v in data.items() if self._values.get(k, self) != v}):
+            self._values.update(data)
+            self.data = self.data | data
+            self.changed = changed
+            self.async_update_listeners()
+
+    async def async_read(self, requests: list[dict]) -> dict[str, Any]:
+        async with self._lock:
+            data = await self.device.get(int(self._counter * self._update_interval_seconds), requests)
+        # Every key read is dispatched so optimistic states are replaced even when the value did not change
+        self.async_push(data, set(data))
+        return data
+
     async def _async_update_data(self) -> dict[str, Any]:
+        async with self._lock:
+            data = await self._async_poll()
+        while self._revalidations:
+            self.hass.async_create_background_task(self._revalidations.pop()(), f"{DOMAIN} {self.name} autodetection")
+        return data
+
+    async def _async_poll(self) -> dict[str, Any]:
+        entries = self.scheduler.due(monotonic()) if self.scheduler is not None else None
+        requests = Scheduler.requests(entries) if entries is not None else None
+        # Realtime items are read with the first refresh so their entities don't start unknown, and in place of a failing fast lane
+        if requests is not None and (self.data is None or self._realtime_failures >= TIMINGS_REALTIME_FAILURES):
+            requests = requests + self._realtime_requests
         try:
             try:
-                return await self.device.get(int(self._counter * self._update_interval_seconds))
+                if requests is not None and len(requests) == 0:
+                    self.changed = set()
+                    return {}
+                start, started = self.metrics.start(), monotonic()
+                data = await self.device.get(int(self._counter * self._update_interval_seconds), requests)
+                self._record_timings(requests, monotonic() - started)
+                self.metrics.stop("poll", start)
+                if self._connection is not None and self._connection.metrics is self.metrics and self._connection.received > start:
+                    # From the last response to the end of the device's get, mostly the parsing of the responses
+                    self.metrics.stop("after_read", self._connection.received)
+                self.changed = {k for k, v in data.items() if self._values.get(k, self) != v}
+                self._values.update(data)
+                if monotonic() - self._replanned >= TIMINGS_REPLAN_INTERVAL:
+                    self.async_replan()
+                return data
             finally:
                 self._counter += 1
+                # Saved once per delay, calling async_delay_save every poll would keep postponing the save
+                if not self._timings_saving:
+                    self._timings_saving = True
+                    self._timings_store.async_delay_save(self._timings_data, TIMINGS_STORAGE_DELAY)
         except Exception as e:
-            self._counter = 0
+            self.metrics.count("failed_polls")
+            if entries:
+                self.scheduler.retry(entries, monotonic())
+            self.changed = set()
             if isinstance(e, TimeoutError):
                 raise
             raise UpdateFailed(e) from e
 
+    def _record_timings(self, requests: list[dict] | None, seconds: float) -> None:
+        # A connected transport times each request itself, otherwise a poll counts as requests of its mean size and duration
+        if not requests or (self._connection is not None and self._connection.connected and self._connection.timings is self.timings):
+            return
+        self.timings.record(round(sum(r[REQUEST_END] - r[REQUEST_START] + 1 for r in requests) / len(requests)), seconds / len(requests))
+
+    def _timings_data(self) -> dict:
+        self._timings_saving = False
+        return self.timings.as_dict()
+
     async def async_shutdown(self) -> None:
         _LOGGER.debug("async_shutdown")
+        if self._realtime is not None:
+            self._realtime.cancel()
+            self._realtime = None
+        if self._replan is not None:
+            self._replan.cancel()
+            self._replan = None
+        if self._unsub_registry is not None:
+            self._unsub_registry()
+            self._unsub_registry = None
+        self.writes.cancel()
+        if self._connection is not None:
+            if self._connection.metrics is self.metrics:
+                self._connection.metrics = Metrics()
+            await release_connection(self._connection)
+            self._connection = None
         await super().async_shutdown()
         await self.device.shutdown()
+        if self.profile is not None:
+            release_profile(self.hass, self.profile)
+            self.profile = None
+        await self._timings_store.async_save(self.timings.as_dict())
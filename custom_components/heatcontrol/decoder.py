@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import logging
+
+from array import array
+from typing import Any
+from operator import add, itemgetter, mul, sub
+
+from .const import *
+from .common import *
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rules decoded in batches: rule -> signed
+DECODER_RULES = { 1: False, 2: True, 3: False, 4: True }
+
+# Batches are used for groups of at least DECODER_GROUP_MIN items and profiles with at least DECODER_BATCH_MIN items in such groups
+DECODER_GROUP_MIN = 4
+DECODER_BATCH_MIN = 24
+
+# Items using any of these are decoded one by one
+DECODER_PER_ITEM = ("sensors", "lookup", "range", "validation", "mask", "bit", "divide", "magnitude", "uint")
+
+def is_batchable(item):
+    return item.get("rule") in DECODER_RULES and (registers := item.get("registers")) and 0 < len(registers) < 5 and not any(k in item for k in DECODER_PER_ITEM)
+
+# Results have the shape of the parser's: key -> (state, raw value), states rounded to the digits of the item or the profile
+
+def decode_item(data, item, code = DEFAULT_[REGISTERS_CODE], digits = DEFAULT_[DIGITS]):
+    code = get_code(item, "read", code)
+    value, shift = 0, 0
+    for r in item["registers"]:
+        if (v := get_addr_value(data, code, r)) is None:
+            return None
+        value += (v & 0xFFFF) << shift
+        shift += 16
+    if DECODER_RULES[item["rule"]] and value > (1 << shift - 1) - 1:
+        value -= 1 << shift
+    raw = value
+    if (offset := item.get("offset")):
+        value -= offset
+    if (scale := item.get("scale")) is not None and scale != 1:
+        value *= scale
+    return get_number(value, item.get(DIGITS, digits)), raw
+
+class BatchDecoder:
+    def __init__(self, items, code = DEFAULT_[REGISTERS_CODE], digits = DEFAULT_[DIGITS]):
+        self.code = code
+        self.digits = digits
+        self.groups = {}
+        self.spans = {}
+
+        groups = {}
+        for i in filter(is_batchable, items):
+            groups.setdefault((get_code(i, "read", code), len(i["registers"]), DECODER_RULES[i["rule"]], i.get("offset") or 0, s if (s := i.get("scale")) is not None else 1, i.get(DIGITS, digits)), []).append(i)
+
+        # Flattening the responses costs more than it saves for small groups and profiles, their items are decoded one by one
+        batched = {k: g for k, g in groups.items() if len(g) >= DECODER_GROUP_MIN}
+        if sum(len(g) for g in batched.values()) < DECODER_BATCH_MIN:
+            batched = {}
+        self.items = [i for k, g in groups.items() if not k in batched for i in g]
+
+        for k, g in batched.items():
+            self.groups[k] = ([i["key"] for i in g], [i["registers"] for i in g])
+            registers = [r for i in g for r in i["registers"]]
+            low, high = self.spans.get(k[0], (registers[0], registers[0]))
+            self.spans[k[0]] = (min(low, *registers), max(high, *registers))
+
+        # Register addresses are rebased to the flat per code arrays once, getters fetch a whole group in one call
+        self.getters = {k: [self._getter([r[w] - self.spans[k[0]][0] for r in v[1]]) for w in range(k[1])] for k, v in self.groups.items()}
+
+    @staticmethod
+    def _getter(indexes):
+        return itemgetter(*indexes) if len(indexes) > 1 else lambda x: (x[indexes[0]],)
+
+    def _flatten(self, data):
+        flat = {}
+        for code, (low, high) in self.spans.items():
+            values, covered = array('H', bytes(2 * (high - low + 1))), bytearray(high - low + 1)
+            for (c, start), block in data.items():
+                if c == code and (s := max(start, low)) <= (e := min(start + len(block) - 1, high)):
+                    values[s - low:e - low + 1] = array('H', block[s - start:e - start + 1])
+                    covered[s - low:e - low + 1] = b'\x01' * (e - s + 1)
+            flat[code] = (values, covered)
+        return flat
+
+    def decode(self, data):
+        result = {i["key"]: v for i in self.items if (v := decode_item(data, i, self.code, self.digits)) is not None}
+        if not self.groups:
+            return result
+        flat = self._flatten(data)
+
+        for (code, size, signed, offset, scale, digits), (keys, _) in self.groups.items():
+            values, covered = flat[code]
+            getters = self.getters[(code, size, signed, offset, scale, digits)]
+            words = [g(values) for g in getters]
+            present = all(all(g(covered)) for g in getters)
+
+            if size == 1:
+                decoded = words[0]
+            elif size == 2:
+                decoded = [l + (h << 16) for l, h in zip(*words)]
+            else:
+                decoded = [sum(w << (16 * n) for n, w in enumerate(v)) for v in zip(*words)]
+
+            if signed:
+                limit, wrap = (1 << (16 * size - 1)) - 1, 1 << (16 * size)
+                decoded = [v - wrap if v > limit else v for v in decoded]
+            raws = decoded
+            if offset:
+                decoded = [v - offset for v in decoded]
+            if scale != 1:
+                decoded = [v * scale for v in decoded]
+            decoded = zip([get_number(v, digits) for v in decoded], raws)
+
+            if present:
+                result.update(zip(keys, decoded))
+            else:
+                marks = [all(m) for m in zip(*(g(covered) for g in getters))]
+                result.update((k, v) for k, v, m in zip(keys, decoded, marks) if m)
+
+        return result
+
+# Operators combining the parts of a composite: operator -> (value, part) -> value
+COMPOSITE_OPERATORS = { None: add, "add": add, "subtract": sub, "multiply": mul, "divide": lambda x, y: x / y if y != 0 else 0 }
+
+def decode_sensor(data, sensor, code = DEFAULT_[REGISTERS_CODE]):
+    code = get_code(sensor, "read", code)
+    value, shift = 0, 0
+    for r in sensor["registers"]:
+        if (v := get_addr_value(data, code, r)) is None:
+            return None
+        value += (v & 0xFFFF) << shift
+        shift += 16
+    if "signed" in sensor and value > (1 << shift - 1) - 1:
+        value -= 1 << shift
+    if (offset := sensor.get("offset")):
+        value -= offset
+    if (scale := sensor.get("scale")) is not None and scale != 1:
+        value *= scale
+    return value
+
+def is_valid(value, validation):
+    return not ("min" in validation and validation["min"] > value) and not ("max" in validation and validation["max"] < value)
+
+def decode_composite(data, item, code = DEFAULT_[REGISTERS_CODE], digits = DEFAULT_[DIGITS]):
+    value = 0
+    for s in item["sensors"]:
+        if (n := decode_sensor(data, s, code)) is None:
+            return None
+        if (m := s.get("multiply")) is not None:
+            if (f := decode_sensor(data, m, code)) is None:
+                return None
+            n *= f
+        if (v := s.get("validation")) is not None and not is_valid(n, v):
+            if not "default" in v:
+                return None
+            n = v["default"]
+        value = COMPOSITE_OPERATORS[s.get("operator")](value, n)
+    if "uint" in item and value < 0:
+        value = 0
+    return get_number(value, item.get(DIGITS, digits)), None
+
+def compile_sensor(sensor, code = DEFAULT_[REGISTERS_CODE]):
+    code, registers = get_code(sensor, "read", code), tuple(sensor["registers"])
+    inputs = tuple((code, r) for r in registers)
+    limit, wrap = ((1 << 16 * len(registers) - 1) - 1, 1 << 16 * len(registers)) if "signed" in sensor else (None, None)
+    offset, scale = sensor.get("offset"), s if (s := sensor.get("scale")) is not None and s != 1 else None
+
+    def read(values):
+        value, shift = 0, 0
+        for i in inputs:
+            if (v := values[i]) is None:
+                return None
+            value += (v & 0xFFFF) << shift
+            shift += 16
+        if limit is not None and value > limit:
+            value -= wrap
+        if offset:
+            value -= offset
+        if scale is not None:
+            value *= scale
+        return value
+
+    return read, set(inputs)
+
+def compile_composite(item, code = DEFAULT_[REGISTERS_CODE], digits = DEFAULT_[DIGITS]):
+    parts, inputs = [], set()
+    for s in item["sensors"]:
+        read, registers = compile_sensor(s, code)
+        multiply, factors = compile_sensor(m, code) if (m := s.get("multiply")) is not None else (None, set())
+        inputs |= registers | factors
+        parts.append((read, multiply, v if (v := s.get("validation")) is not None else None, COMPOSITE_OPERATORS[s.get("operator")]))
+    parts, uint, digits = tuple(parts), "uint" in item, item.get(DIGITS, digits)
+
+    def evaluate(values):
+        value = 0
+        for read, multiply, validation, operate in parts:
+            if (n := read(values)) is None:
+                return None
+            if multiply is not None:
+                if (f := multiply(values)) is None:
+                    return None
+                n *= f
+            if validation is not None and not is_valid(n, validation):
+                if not "default" in validation:
+                    return None
+                n = validation["default"]
+            value = operate(value, n)
+        if uint and value < 0:
+            value = 0
+        return get_number(value, digits), None
+
+    return evaluate, inputs
+
+class CompositeDecoder:
+    def __init__(self, items, code = DEFAULT_[REGISTERS_CODE], digits = DEFAULT_[DIGITS]):
+        self.keys, self.evaluators = [], []
+        # Register -> indexes of the composites reading it
+        self.dependents: dict[tuple[int, int], list[int]] = {}
+
+        for n, i in enumerate(i for i in items if "sensors" in i):
+            evaluate, inputs = compile_composite(i, code, digits)
+            self.keys.append(i["key"])
+            self.evaluators.append(evaluate)
+            for r in inputs:
+                self.dependents.setdefault(r, []).append(n)
+
+        self.registers: dict[tuple[int, int], int | None] = {}
+        self.results: list[Any] = [None] * len(self.keys)
+        self.evaluated = 0
+
+    def decode(self, data):
+        get = register_map(data).get_addr_value
+        registers, dirty = self.registers, set()
+
+        # Only composites with an input register that changed (or went missing) since the last decode are evaluated again
+        for (code, addr), dependents in self.dependents.items():
+            if (v := get(code, addr)) != registers.get((code, addr), self):
+                registers[(code, addr)] = v
+                dirty.update(dependents)
+
+        # Evaluators read their inputs from the register snapshot
+        for n in dirty:
+            self.results[n] = self.evaluators[n](registers)
+        self.evaluated = len(dirty)
+
+        return {k: v for k, v in zip(self.keys, self.results) if v is not None}
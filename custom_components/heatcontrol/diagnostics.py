@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import logging
+
+from typing import Any
+
+from homeassistant.core import HomeAssistant
+from homeassistant.components.diagnostics import async_redact_data
+
+from .const import *
+from .entity import SolarmanConfigEntry
+
+_LOGGER = logging.getLogger(__name__)
+
+_REDACT = { CONF_HOST, CONF_SERIAL, "unique_id" }
+
+async def async_get_config_entry_diagnostics(_: HomeAssistant, config_entry: SolarmanConfigEntry) -> dict[str, Any]:
+    _LOGGER.debug(f"async_get_config_entry_diagnostics: {config_entry.entry_id}")
+
+    coordinator = config_entry.runtime_data
+
+    return {
+        "config_entry": async_redact_data(config_entry.as_dict(), _REDACT),
+        "counters": dict(coordinator.counters),
+        "metrics": coordinator.metrics.as_dict() if coordinator.metrics.enabled else None,
+        "timings": coordinator.timings.as_dict(),
+        "slips": {f"{c:#04x} {s:#06x}-{e:#06x}": v for (c, s, e), v in coordinator.scheduler.slips.items()} if coordinator.scheduler is not None else None,
+        "disabled": sorted(coordinator.disabled)
+    }
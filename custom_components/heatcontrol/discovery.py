@@ -4,9 +4,11 @@ import socket
 import logging
 import asyncio
 
+from time import monotonic
 from ipaddress import IPv4Network
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, Event, callback
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 from homeassistant.components import network
 
 from .const import *
@@ -14,6 +16,16 @@ from .common import *
 
 _LOGGER = logging.getLogger(__name__)
 
+# Every discovery response lands here: serial -> (seen, {"ip", "mac"})
+_DEVICES: dict[int, tuple[float, dict[str, str]]] = {}
+
+def cache_device(serial: int, device: dict[str, str]) -> None:
+    _DEVICES[serial] = (monotonic(), device)
+
+def cached_devices(serial: int | None = None) -> dict[int, dict[str, str]]:
+    expired = monotonic() - DISCOVERY_CACHE_TTL
+    return {s: d for s, (seen, d) in _DEVICES.items() if seen > expired and (serial is None or s == serial)}
+
 class DiscoveryProtocol:
     def __init__(self, addresses):
         self.addresses = addresses
@@ -23,13 +35,18 @@ class DiscoveryProtocol:
     def connection_made(self, transport):
         self.transport = transport
         _LOGGER.debug(f"DiscoveryProtocol: Send to {self.addresses}")
-        for address in ensure_list(self.addresses):
+        self.send(self.addresses)
+
+    def send(self, addresses):
+        for address in ensure_list(addresses):
             self.transport.sendto(DISCOVERY_MESSAGE[0], (address, DISCOVERY_PORT))
 
     def datagram_received(self, d, _):
         if len(data := d.decode().split(',')) == 3:
             serial = int(data[2])
-            self.responses.put_nowait((serial, {"ip": data[0], "mac": data[1]}))
+            cache_device(serial, device := {"ip": data[0], "mac": data[1]})
+            if self.responses is not None:
+                self.responses.put_nowait((serial, device))
             _LOGGER.debug(f"DiscoveryProtocol: [{data[0]}, {data[1]}, {serial}]")
 
     def error_received(self, e):
@@ -40,6 +57,7 @@ class DiscoveryProtocol:
 
 class Discovery:
     networks = None
+    adapters = None
 
     def __init__(self, hass: HomeAssistant, ip = None, serial = None):
         self._hass = hass
@@ -49,6 +67,7 @@ class Discovery:
 
     async def _discover(self, ips = IP_BROADCAST, wait = False):
         loop = asyncio.get_running_loop()
+        transport = None
 
         try:
             transport, protocol = await loop.create_datagram_endpoint(lambda: DiscoveryProtocol(ips), family = socket.AF_INET, allow_broadcast = True)
@@ -61,19 +80,34 @@ class Discovery:
         except Exception as e:
             _LOGGER.debug(f"_discover exception: {format_exception(e)}")
         finally:
-            transport.close()
+            if transport is not None:
+                transport.close()
+
+    async def _networks(self):
+        # Networks are rebuilt only when the adapters reported by Home Assistant change
+        if (adapters := [ipv4["address"] + '/' + str(ipv4["network_prefix"]) for adapter in await network.async_get_adapters(self._hass) if len(adapter["ipv4"]) > 0 for ipv4 in adapter["ipv4"]]) != Discovery.adapters:
+            Discovery.networks = [x for x in [IPv4Network(a, False) for a in adapters] if not x.is_loopback]
+            Discovery.adapters = adapters
+        return Discovery.networks
 
     async def _discover_all(self):
-        if Discovery.networks is None:
-            Discovery.networks = [x for x in [IPv4Network(ipv4["address"] + '/' + str(ipv4["network_prefix"]), False) for adapter in await network.async_get_adapters(self._hass) if len(adapter["ipv4"]) > 0 for ipv4 in adapter["ipv4"]] if not x.is_loopback]
+        networks = await self._networks()
+
+        _LOGGER.debug(f"_discover_all: Broadcasting on {networks}")
+
+        # Each network is probed through its own endpoint at the same time
+        async def discover_network(net):
+            return [item async for item in self._discover(str(net.broadcast_address), True)]
 
-        _LOGGER.debug(f"_discover_all: Broadcasting on {Discovery.networks}")
-        async for item in self._discover([str(net.broadcast_address) for net in Discovery.networks], True):
-            yield item
+        return {item[0]: item[1] for items in await asyncio.gather(*(discover_network(net) for net in networks)) for item in items}
 
-    async def discover(self, ping_only = False):
+    async def discover(self, ping_only = False, cached = False):
         self._devices = {}
 
+        if cached and (devices := cached_devices(self._serial)):
+            _LOGGER.debug(f"discover: Using cached {devices}")
+            return devices
+
         if self._ip:
             _LOGGER.debug(f"_discover: Broadcasting on {self._ip}")
             self._devices = {item[0]: item[1] async for item in self._discover(self._ip)}
@@ -86,9 +120,44 @@ class Discovery:
         while len(self._devices) == 0 and attempts_left > 0:
             attempts_left -= 1
 
-            self._devices = {item[0]: item[1] async for item in self._discover_all()}
+            self._devices = await self._discover_all()
 
             if len(self._devices) == 0:
                 _LOGGER.debug(f"discover: {f'attempts left: {attempts_left}{'' if attempts_left > 0 else ', aborting.'}'}")
 
         return self._devices
+
+    async def listen(self):
+        # Passive listener: one long lived endpoint re-broadcasting periodically, every response refreshes the cache
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(lambda: DiscoveryProtocol([]), family = socket.AF_INET, allow_broadcast = True)
+        protocol.responses = None
+        try:
+            while True:
+                protocol.send([str(net.broadcast_address) for net in await self._networks()])
+                await asyncio.sleep(DISCOVERY_INTERVAL)
+        finally:
+            transport.close()
+
+def resolver(hass: HomeAssistant):
+    async def resolve(serial: int, host: str) -> str | None:
+        # Unicast probe of the last known address first, then the cache and a broadcast as the last resort
+        if serial in (devices := await Discovery(hass, host, serial).discover(ping_only = True)):
+            return devices[serial]["ip"]
+        if (device := cached_devices(serial).get(serial)) and device["ip"] != host:
+            return device["ip"]
+        if (device := (await Discovery(hass, serial = serial).discover()).get(serial)):
+            return device["ip"]
+        return None
+
+    return resolve
+
+@callback
+def async_start_listener(hass: HomeAssistant) -> None:
+    task = hass.async_create_background_task(Discovery(hass).listen(), f"{DOMAIN} discovery")
+
+    @callback
+    def stop(_: Event) -> None:
+        task.cancel()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, stop)
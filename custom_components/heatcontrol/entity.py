@@ -2,7 +2,10 @@ from __future__ import annotations
 
 import logging
 
+from time import monotonic
 from typing import Any
+from types import MappingProxyType
+from collections.abc import Mapping
 from decimal import Decimal
 from datetime import date, datetime, time
 
@@ -10,6 +13,7 @@ from homeassistant.util import slugify
 from homeassistant.core import split_entity_id, callback
 from homeassistant.const import EntityCategory, STATE_UNKNOWN, CONF_FRIENDLY_NAME
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.helpers import device_registry as dr, entity_registry as er
 from homeassistant.helpers.entity import EntityDescription
 from homeassistant.helpers.entity_registry import RegistryEntry
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
@@ -18,7 +22,9 @@ from homeassistant.helpers.typing import UNDEFINED, StateType, UndefinedType
 from .const import *
 from .common import *
 from .services import *
+from .attributes import EMPTY_ATTRIBUTES, acquire_attributes, release_attributes
 from .coordinator import Coordinator
+from .profile import plan_requests
 from .pysolarman.pysolarman import FUNCTION_CODE
 
 _LOGGER = logging.getLogger(__name__)
@@ -39,13 +45,56 @@ def migrate_unique_ids(name: str, serial: int, entity_entry: RegistryEntry) -> d
 
     return None
 
+def create_entities(coordinator, platform, creator, descriptions):
+    # Disabled items are only registered, no entity object is built until they are enabled (which reloads the entry)
+    config = coordinator.device.config
+    registry = er.async_get(coordinator.hass)
+    device_id = None
+    entities = []
+    disabled = 0
+
+    for description in descriptions:
+        # Disabled keys are the item keys the requests are planned from, not the names looked up
+        key = description["key"]
+
+        if (nlookup := description.get("name_lookup")) is not None and (prefix := coordinator.data.get(nlookup)) is not None:
+            # Descriptions can be shared between entries, don't modify them in place
+            description = dict(description)
+            description["name"] = replace_first(description["name"], get_tuple(prefix))
+            description["key"] = entity_key(description)
+            del description["name_lookup"]
+
+        unique_id = slugify('_'.join(filter(None, (config.name, str(config.serial), description["key"]))))
+
+        if (entity_id := registry.async_get_entity_id(platform, DOMAIN, unique_id)) is not None:
+            if registry.entities[entity_id].disabled:
+                coordinator.disabled.add(key)
+                disabled += 1
+                continue
+        elif "disabled" in description:
+            if device_id is None:
+                device_id = dr.async_get(coordinator.hass).async_get_or_create(config_entry_id = coordinator.config_entry.entry_id, **coordinator.device.device_info.get(config.serial)).id
+            registry.async_get_or_create(platform, DOMAIN, unique_id, config_entry = coordinator.config_entry, device_id = device_id, disabled_by = er.RegistryEntryDisabler.INTEGRATION, hidden_by = er.RegistryEntryHider.INTEGRATION if "hidden" in description else None, has_entity_name = True, original_name = description["name"], translation_key = description.get("translation_key") or slugify(description["name"]), suggested_object_id = slugify(f"{config.name} {description['name']}"))
+            coordinator.disabled.add(key)
+            disabled += 1
+            continue
+
+        entities.append(create_entity(creator, description))
+
+    _LOGGER.debug(f"create_entities: {platform}: {len(entities)} created, {disabled} disabled")
+
+    return entities
+
 def create_entity(creator, description):
     try:
         entity = creator(description)
 
         if description is not None and (nlookup := description.get("name_lookup")) is not None and (prefix := entity.coordinator.data.get(nlookup)) is not None:
+            # Descriptions can be shared between entries, don't modify them in place
+            description = dict(description)
             description["name"] = replace_first(description["name"], get_tuple(prefix))
             description["key"] = entity_key(description)
+            release_attributes(entity._static_attributes)
             entity = creator(description)
 
         entity.update()
@@ -61,8 +110,24 @@ class SolarmanCoordinatorEntity(CoordinatorEntity[Coordinator]):
         self._attr_device_info = self.coordinator.device.device_info.get(coordinator.device.config.serial)
         self._attr_state: StateType = STATE_UNKNOWN
         self._attr_native_value: StateType | str | date | datetime | time | float | Decimal = None
+        # Dynamic attributes only, the static ones are shared between entities
         self._attr_extra_state_attributes: dict[str, Any] = {}
-        self._attr_value: None = None
+        self._static_attributes: MappingProxyType = EMPTY_ATTRIBUTES
+        self._attr_value = None
+        self._dependencies: frozenset[str] | None = None
+        self._deadband: float | None = None
+        self._heartbeat: float | None = None
+        self._written: tuple | None = None
+        self._written_at: float = 0
+
+    @property
+    def extra_state_attributes(self) -> Mapping[str, Any]:
+        return self._static_attributes | self._attr_extra_state_attributes if self._attr_extra_state_attributes else self._static_attributes
+
+    async def async_will_remove_from_hass(self) -> None:
+        release_attributes(self._static_attributes)
+        self._static_attributes = EMPTY_ATTRIBUTES
+        await super().async_will_remove_from_hass()
 
     @property
     def device_name(self) -> str:
@@ -74,9 +139,32 @@ class SolarmanCoordinatorEntity(CoordinatorEntity[Coordinator]):
 
     @callback
     def _handle_coordinator_update(self) -> None:
+        heartbeat = self._heartbeat is not None and monotonic() - self._written_at >= self._heartbeat
+        if not heartbeat and self._written is not None and self._dependencies is not None and (changed := self.coordinator.changed) is not None and changed.isdisjoint(self._dependencies) and self._written[0] == self.available:
+            self.coordinator.counters["skipped_writes"] += 1
+            return
         self.update()
+        if not heartbeat and self.is_unchanged():
+            self.coordinator.counters["skipped_writes"] += 1
+            return
+        self.coordinator.counters["writes"] += 1
         self.async_write_ha_state()
 
+    def is_unchanged(self) -> bool:
+        if (written := self._written) is None or written[0] != self.available:
+            return False
+        if written[1] == self._attr_native_value and written[2] == self._attr_extra_state_attributes:
+            return True
+        # Within the deadband only the raw "value" attribute may differ
+        return self._deadband is not None and isinstance(written[1], (int, float)) and isinstance(self._attr_native_value, (int, float)) and abs(self._attr_native_value - written[1]) < self._deadband and {k: v for k, v in written[2].items() if k != "value"} == {k: v for k, v in self._attr_extra_state_attributes.items() if k != "value"}
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        start = self.coordinator.metrics.start()
+        self._written, self._written_at = (self.available, self._attr_native_value, dict(self._attr_extra_state_attributes)), monotonic()
+        super().async_write_ha_state()
+        self.coordinator.metrics.stop("write_state", start)
+
     def set_state(self, state, value = None) -> bool:
         self._attr_native_value = self._attr_state = state
         if value is not None:
@@ -108,21 +196,30 @@ class SolarmanEntity(SolarmanCoordinatorEntity):
 
         if (unit_of_measurement := sensor.get("uom") or sensor.get("unit_of_measurement")):
             self._attr_native_unit_of_measurement = unit_of_measurement
+        static = {}
         if (options := sensor.get("options")):
             self._attr_options = options
-            self._attr_extra_state_attributes = self._attr_extra_state_attributes | { "options": options }
+            static["options"] = options
         elif "lookup" in sensor and "rule" in sensor and 0 < sensor["rule"] < 5 and (options := [s["value"] for s in sensor["lookup"]]):
             self._attr_device_class = "enum"
             self._attr_options = options
-            self._attr_extra_state_attributes = self._attr_extra_state_attributes | { "options": options }
+            static["options"] = options
         if alt := sensor.get("alt"):
-            self._attr_extra_state_attributes = self._attr_extra_state_attributes | { "Alt Name": alt }
+            static["Alt Name"] = alt
         if description := sensor.get("description"):
-            self._attr_extra_state_attributes = self._attr_extra_state_attributes | { "description": description }
+            static["description"] = description
+        self._static_attributes = acquire_attributes(static)
 
         self.attributes = {slugify('_'.join(filter(None, (x, "sensor")))): x for x in attrs} if (attrs := sensor.get("attributes")) is not None else None
         self.registers = sensor.get("registers")
 
+        self._dependencies = frozenset((self._attr_key, *(self.attributes or ())))
+        self._deadband = sensor.get("deadband")
+        self._heartbeat = sensor.get("heartbeat")
+
+        # Coordinator dispatches updates only to entities depending on the refreshed keys
+        self.coordinator_context = self._dependencies if self._heartbeat is None else None
+
     def _friendly_name_internal(self) -> str | None:
         name = self.name if self.name is not UNDEFINED else None
         if self.platform and (name_translation_key := self._name_translation_key) and (n := self.platform.platform_translations.get(name_translation_key)):
@@ -147,6 +244,10 @@ class SolarmanWritableEntity(SolarmanEntity):
         self.code = get_code(sensor, "write", FUNCTION_CODE.WRITE_MULTIPLE_REGISTERS)
         self.register = min(self.registers) if len(self.registers) > 0 else None
 
+        default = self.coordinator.profile["default"] if self.coordinator.profile else {}
+        self._verify = sensor.get("verify", default.get("verify", WRITE_VERIFY))
+        self._verify_requests = plan_requests([sensor], self.coordinator.profile[REQUEST_CODE], False, 1) if self._verify and self.coordinator.profile else None
+
     async def write(self, value, state = None) -> None:
         #self.coordinator.device.check(self._write_lock)
         if isinstance(value, int):
@@ -157,8 +258,25 @@ class SolarmanWritableEntity(SolarmanEntity):
         if isinstance(value, list):
             while len(self.registers) > len(value):
                 value.insert(0, 0)
-        if await self.coordinator.device.exe(self.code, address = self.register, registers = value) > 0 and state is not None:
+        if await self.coordinator.writes.write(self.code, self.register, value) <= 0:
+            return
+        if state is not None:
             self.set_state(state, value)
             self.async_write_ha_state()
+            # Compare the next poll against the polled value, not the optimistic one
+            self._written = None
             #await self.entity_description.update_fn(self.coordinator., int(value))
-            #await self.coordinator.async_request_refresh()
\ No newline at end of file
+            #await self.coordinator.async_request_refresh()
+        if self._verify_requests:
+            await self.verify(state)
+
+    async def verify(self, state = None) -> None:
+        try:
+            data = await self.coordinator.async_read(self._verify_requests)
+        except Exception as e:
+            _LOGGER.debug(f"[{self._attr_key}] verify: {format_exception(e)}")
+            return
+        if (read := data.get(self._attr_key)) is None:
+            _LOGGER.warning(f"[{self._attr_key}] Verification failed, registers {self.registers} not read back")
+        elif state is not None and read[0] != state:
+            _LOGGER.warning(f"[{self._attr_key}] Verification failed, wrote {state} but read back {read[0]}")
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import logging
+
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+
+from .entity import create_entity, SolarmanEntity
+
+_LOGGER = logging.getLogger(__name__)
+
+# Diagnostic sensors of the instrumentation: (description, stage, statistic), counters have no stage
+METRIC_SENSORS = (
+    ({"key": "poll_p95_sensor", "name": "Poll p95", "uom": UnitOfTime.MILLISECONDS}, "poll", "p95"),
+    ({"key": "request_p95_sensor", "name": "Request p95", "uom": UnitOfTime.MILLISECONDS}, "request", "p95"),
+    ({"key": "after_read_p95_sensor", "name": "After read p95", "uom": UnitOfTime.MILLISECONDS}, "after_read", "p95"),
+    ({"key": "dispatch_p95_sensor", "name": "Dispatch p95", "uom": UnitOfTime.MILLISECONDS}, "dispatch", "p95"),
+    ({"key": "failed_polls_sensor", "name": "Failed polls"}, None, "failed_polls"),
+    ({"key": "timeouts_sensor", "name": "Timeouts"}, None, "timeouts"),
+)
+
+def create_metric_sensors(coordinator):
+    # Added by the sensor platform next to the profile's sensors, only when the instrumentation is enabled
+    return [create_entity(lambda _: SolarmanMetricSensor(coordinator, *m), None) for m in METRIC_SENSORS] if coordinator.metrics.enabled else []
+
+class SolarmanMetricSensor(SolarmanEntity, SensorEntity):
+    def __init__(self, coordinator, sensor, stage, statistic):
+        SolarmanEntity.__init__(self, coordinator, sensor | {"category": EntityCategory.DIAGNOSTIC})
+        self._attr_state_class = SensorStateClass.MEASUREMENT if stage is not None else SensorStateClass.TOTAL_INCREASING
+        self._stage = stage
+        self._statistic = statistic
+        # Metrics change with every update, not with the data keys
+        self._dependencies = None
+        self.coordinator_context = None
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def update(self):
+        if self._stage is None:
+            self.set_state(self.coordinator.metrics.counters.get(self._statistic, 0))
+        elif (histogram := self.coordinator.metrics.stages.get(self._stage)) is not None:
+            self.set_state(histogram.as_dict()[self._statistic])
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from time import perf_counter
+from typing import Any
+
+from .const import *
+
+class Histogram:
+    __slots__ = ("samples", "index", "count", "total")
+
+    def __init__(self):
+        self.samples: list[float] = []
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value: float) -> None:
+        # Percentiles are taken over the last METRICS_SAMPLES values
+        if len(self.samples) < METRICS_SAMPLES:
+            self.samples.append(value)
+        else:
+            self.samples[self.index] = value
+            self.index = (self.index + 1) % METRICS_SAMPLES
+        self.count += 1
+        self.total += value
+
+    def percentile(self, samples: list[float], p: int) -> float:
+        return samples[min(int(len(samples) * p / 100), len(samples) - 1)] if samples else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        samples = sorted(self.samples)
+        return { "count": self.count, "mean": round(self.total / self.count * 1000, 3) if self.count else 0.0, **{f"p{p}": round(self.percentile(samples, p) * 1000, 3) for p in (50, 95, 99)} }
+
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+
+    def start(self) -> float:
+        return perf_counter() if self.enabled else 0.0
+
+    def stop(self, stage: str, start: float) -> None:
+        if self.enabled:
+            if (histogram := self.stages.get(stage)) is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.record(perf_counter() - start)
+
+    def count(self, counter: str, value: int = 1) -> None:
+        if self.enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def as_dict(self) -> dict[str, Any]:
+        # Stage timings are in milliseconds
+        return { "stages": {k: v.as_dict() for k, v in self.stages.items()}, "counters": dict(self.counters) }
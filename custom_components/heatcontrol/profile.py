@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+import sys
+import asyncio
+import hashlib
+import logging
+
+from typing import Any
+from types import MappingProxyType
+
+from homeassistant.core import HomeAssistant
+
+from .const import *
+from .common import *
+from .timings import RequestTimings
+
+_LOGGER = logging.getLogger(__name__)
+
+# Process-wide registry of shared profiles: key -> [references, stamp, profile, eviction handle]
+# Unreferenced entries are kept for TIMINGS_PROFILE_RELEASE, so reloading an entry reuses the profile unless its file has changed
+_PROFILES: dict[tuple, list] = {}
+_PROFILES_LOCKS: dict[tuple, asyncio.Lock] = {}
+
+def profile_key(file: str, attr: dict[str, Any]) -> tuple:
+    return (os.path.abspath(file), *(attr.get(ATTR_[k]) for k in (CONF_MOD, CONF_MPPT, CONF_PHASE, CONF_PACK)))
+
+def compile_profile(profile: dict[str, Any], attr: dict[str, Any]) -> dict[str, Any]:
+    default = profile.get("default", {})
+    update_interval = default.get(UPDATE_INTERVAL, DEFAULT_[UPDATE_INTERVAL])
+    code = default.get(REQUEST_CODE, DEFAULT_[REGISTERS_CODE])
+    min_span = default.get(REQUEST_MIN_SPAN, DEFAULT_[REGISTERS_MIN_SPAN])
+    max_size = default.get(REQUEST_MAX_SIZE, DEFAULT_[REGISTERS_MAX_SIZE])
+    table = {r: get_request_code(pr) for pr in profile["requests"] for r in range(pr[REQUEST_START], pr[REQUEST_END] + 1)} if "requests" in profile else {}
+
+    items = [i for i in sorted([process_descriptions(item, group, table, code, attr[ATTR_[CONF_MOD]]) for group in profile["parameters"] for item in group["items"]], key = lambda x: (get_code(x, "read", code), max(x["registers"])) if "registers" in x else (-1, -1)) if len((a := i.keys() & attr.keys())) == 0 or ((k := next(iter(a))) and i[k] <= attr[k])]
+
+    is_single_code = False
+    if (items_codes := [get_code(i, "read", code) for i in items if "registers" in i]) and (is_single_code := all_same(items_codes)):
+        code = items_codes[0]
+
+    return {
+        "info": profile.get("info"),
+        "default": default,
+        UPDATE_INTERVAL: update_interval,
+        REQUEST_CODE: code,
+        REQUEST_MIN_SPAN: min_span,
+        REQUEST_MAX_SIZE: max_size,
+        IS_SINGLE_CODE: is_single_code,
+        "items": items,
+        "requests": plan_requests(items, code, is_single_code, min_span, max_size),
+        **dict(zip(("schedule", REQUEST_REALTIME), plan_schedule(items, update_interval, code, is_single_code, min_span, max_size))),
+        REQUEST_REALTIME_INTERVAL: default.get(REQUEST_REALTIME_INTERVAL, TIMINGS_REALTIME_INTERVAL)
+    }
+
+def plan_schedule(items, update_interval = DEFAULT_[UPDATE_INTERVAL], code = DEFAULT_[REGISTERS_CODE], is_single_code = False, min_span = DEFAULT_[REGISTERS_MIN_SPAN], max_size = DEFAULT_[REGISTERS_MAX_SIZE], timings: RequestTimings | None = None):
+    schedule = {i: plan_requests(g, code, is_single_code, min_span, max_size, timings) for i, g in group_by_interval([i for i in items if not "realtime" in i], update_interval).items()}
+    # Realtime items are read by the fast lane in minimal contiguous blocks
+    return schedule, plan_requests([i for i in items if "realtime" in i], code, is_single_code, 1, max_size)
+
+def replan_schedule(profile, items, excluded, timings: RequestTimings | None = None):
+    # The schedule compiled (and cached) with the profile is used until there is something to leave out or a learned timing model
+    if not excluded and (timings is None or timings.model() is None):
+        return dict(profile["schedule"]), profile[REQUEST_REALTIME]
+    return plan_schedule([i for i in items if not i["key"] in excluded], profile[UPDATE_INTERVAL], profile[REQUEST_CODE], profile[IS_SINGLE_CODE], profile[REQUEST_MIN_SPAN], profile[REQUEST_MAX_SIZE], timings)
+
+def group_by_interval(items, update_interval = DEFAULT_[UPDATE_INTERVAL]):
+    groups = {}
+    for i in items:
+        groups.setdefault(max(i.get(UPDATE_INTERVAL, update_interval), TIMINGS_INTERVAL), []).append(i)
+    return groups
+
+def plan_requests(items, code = DEFAULT_[REGISTERS_CODE], is_single_code = False, min_span = DEFAULT_[REGISTERS_MIN_SPAN], max_size = DEFAULT_[REGISTERS_MAX_SIZE], timings: RequestTimings | None = None):
+    return (timings.group if timings is not None else group_registers)(sorted({(get_code(i, "read", code), r) for i in items if "rule" in i and i["rule"] > 0 and "registers" in i for r in i["registers"]}), code if is_single_code else None, min_span, max_size)
+
+def load_profile(file: str, attr: dict[str, Any], cache: str | None = None) -> dict[str, Any]:
+    stat = os.stat(file)
+    key = profile_key(file, attr)
+    stamp = (LOOKUP_CACHE_VERSION, sys.version_info[:2], key, stat.st_mtime_ns, stat.st_size)
+    path = os.path.join(cache, f"{os.path.basename(file)}.{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}.pickle") if cache else None
+
+    if path and (cached := pickle_load(path, stamp)) is not None:
+        return cached
+
+    # Plans are built on the first load and cached with the compiled profile
+    profile = compile_profile(yaml_load(file, cache), dict(attr))
+
+    if path:
+        pickle_dump(path, stamp, profile)
+
+    return profile
+
+async def async_load_profile(hass: HomeAssistant, file: str, attr: dict[str, Any]) -> dict[str, Any]:
+    return await async_execute(lambda: load_profile(file, attr, hass.config.path(LOOKUP_CACHE_DIRECTORY_PATH)))
+
+def profile_stamp(file: str) -> tuple:
+    return (stat := os.stat(file)).st_mtime_ns, stat.st_size
+
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    return tuple(freeze(v) for v in value) if isinstance(value, (list, tuple)) else value
+
+def freeze_profile(profile: dict[str, Any], key: tuple) -> MappingProxyType:
+    return freeze(profile | { "key": key })
+
+async def async_acquire_profile(hass: HomeAssistant, file: str, attr: dict[str, Any]) -> MappingProxyType:
+    key = profile_key(file, attr)
+
+    async with _PROFILES_LOCKS.setdefault(key, asyncio.Lock()):
+        stamp = await async_execute(lambda: profile_stamp(file))
+
+        if (entry := _PROFILES.get(key)) is not None and entry[3] is not None:
+            entry[3].cancel()
+            entry[3] = None
+
+        if entry is None or entry[1] != stamp:
+            _LOGGER.debug(f"async_acquire_profile: Loading {key}")
+            entry = _PROFILES[key] = [0, stamp, freeze_profile(await async_load_profile(hass, file, attr), key), None]
+
+        entry[0] += 1
+
+        return entry[2]
+
+def release_profile(hass: HomeAssistant, profile: MappingProxyType) -> None:
+    # A profile replaced after its file has changed is no longer registered and is dropped with its last holder
+    if (entry := _PROFILES.get(key := profile["key"])) is None or entry[2] is not profile:
+        return
+    entry[0] = max(entry[0] - 1, 0)
+    _LOGGER.debug(f"release_profile: {key} has {entry[0]} references")
+    if entry[0] == 0 and entry[3] is None:
+        entry[3] = hass.loop.call_later(TIMINGS_PROFILE_RELEASE, evict_profile, key)
+
+def evict_profile(key: tuple) -> None:
+    if (entry := _PROFILES.get(key)) is not None and entry[0] == 0:
+        _LOGGER.debug(f"evict_profile: {key}")
+        del _PROFILES[key]
+        if (lock := _PROFILES_LOCKS.get(key)) is not None and not lock.locked():
+            del _PROFILES_LOCKS[key]
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import heapq
+
+from .const import *
+
+class Scheduler:
+    def __init__(self, schedule: dict[int, list[dict]], tick: float, now: float):
+        self.tick = tick
+        # (code, start, end) -> [count, last slip, max slip]
+        self.slips: dict[tuple, list] = {}
+        self._queue: list[list] = []
+        self.replace(schedule, now)
+
+    def replace(self, schedule: dict[int, list[dict]], now: float) -> None:
+        # A request overlapping one of the replaced plan in the same interval takes over its deadline and phase, only new ones are due now
+        replaced, queue, spread = {}, [], 0
+        for entry in self._queue:
+            replaced.setdefault((entry[2], entry[4][REQUEST_CODE]), []).append(entry)
+        for interval, requests in sorted(schedule.items()):
+            for request in requests:
+                if (entry := min((e for e in replaced.get((interval, request[REQUEST_CODE]), ()) if e[4][REQUEST_START] <= request[REQUEST_END] and request[REQUEST_START] <= e[4][REQUEST_END]), default = None)) is not None:
+                    queue.append([entry[0], len(queue), interval, entry[3], request])
+                    continue
+                # Requests slower than the tick get their own phase so they don't all land on the same tick
+                phase = 0 if interval <= self.tick else (spread := spread + 1) * self.tick % interval
+                queue.append([now, len(queue), interval, now - phase, request])
+        heapq.heapify(queue)
+        self._queue = queue
+
+    def _next(self, anchor: float, interval: float, now: float) -> float:
+        return anchor + (int((now - anchor) // interval) + 1) * interval
+
+    def due(self, now: float) -> list[list]:
+        # Half a tick tolerance, the coordinator timer itself drifts
+        entries = []
+        while self._queue and self._queue[0][0] <= now + self.tick / 2:
+            entries.append(entry := heapq.heappop(self._queue))
+            slip = self.slips.setdefault(((r := entry[4])[REQUEST_CODE], r[REQUEST_START], r[REQUEST_END]), [0, 0.0, 0.0])
+            slip[0] += 1
+            slip[1] = max(now - entry[0], 0)
+            slip[2] = max(slip[2], slip[1])
+        # Advanced from the deadline, an entry read early within the tolerance would be due again on the next tick
+        for entry in entries:
+            entry[0] = self._next(entry[3], entry[2], max(now, entry[0]))
+            heapq.heappush(self._queue, entry)
+        return entries
+
+    def retry(self, entries: list[list], now: float) -> None:
+        # Failed requests are retried on the next tick, their phase stays untouched
+        for entry in entries:
+            entry[0] = now + self.tick
+        heapq.heapify(self._queue)
+
+    @staticmethod
+    def requests(entries: list[list]) -> list[dict]:
+        return [e[4] for e in entries]
+
+    @property
+    def max_slip(self) -> float:
+        return max((s[2] for s in self.slips.values()), default = 0.0)
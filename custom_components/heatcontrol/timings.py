@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from .const import *
+from .common import *
+
+class RequestTimings:
+    def __init__(self, samples: dict | None = None):
+        # Request size -> [count, mean round-trip seconds]
+        self.samples = {int(k): v for k, v in samples.items()} if samples else {}
+
+    def record(self, size, seconds):
+        s = self.samples.setdefault(size, [0, 0.0])
+        s[0] = min(s[0] + 1, TIMINGS_SAMPLES_WINDOW)
+        s[1] += (seconds - s[1]) / s[0]
+
+    def model(self):
+        if len(self.samples) < 2 or (n := sum(s[0] for s in self.samples.values())) < TIMINGS_SAMPLES_MIN:
+            return None
+        mx = sum(k * s[0] for k, s in self.samples.items()) / n
+        my = sum(s[1] * s[0] for s in self.samples.values()) / n
+        if (sxx := sum(s[0] * (k - mx) ** 2 for k, s in self.samples.items())) == 0:
+            return None
+        per_register = sum(s[0] * (k - mx) * (s[1] - my) for k, s in self.samples.items()) / sxx
+        return my - per_register * mx, per_register
+
+    def group(self, registers, code = None, min_span = DEFAULT_[REGISTERS_MIN_SPAN], max_size = DEFAULT_[REGISTERS_MAX_SIZE]):
+        if (m := self.model()) is None or m[0] <= 0 or m[1] <= 0:
+            return group_registers(registers, code, min_span, max_size)
+        return group_registers_by_cost(registers, *m, code, max_size)
+
+    def as_dict(self):
+        return {str(k): v for k, v in self.samples.items()}
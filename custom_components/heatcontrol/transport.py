@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import random
+import struct
+import asyncio
+import logging
+
+from time import monotonic
+from collections import deque
+
+from .const import *
+from .metrics import Metrics
+
+_LOGGER = logging.getLogger(__name__)
+
+V5_START = 0xA5
+V5_END = 0x15
+V5_CONTROL_REQUEST = 0x4510
+V5_CONTROL_RESPONSE = 0x1510
+V5_HEADER_SIZE = 11
+V5_REQUEST_PREFIX = bytes([0x02, 0x00, 0x00] + [0x00] * 12)
+V5_RESPONSE_PREFIX_SIZE = 14
+
+def crc16(data: bytes) -> int:
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+def rtu_frame(data: bytes) -> bytes:
+    return data + struct.pack("<H", crc16(data))
+
+def rtu_read(slave: int, code: int, start: int, count: int) -> bytes:
+    return rtu_frame(struct.pack(">BBHH", slave, code, start, count))
+
+def rtu_write(slave: int, code: int, address: int, values: list[int]) -> bytes:
+    if code == 0x06:
+        return rtu_frame(struct.pack(">BBHH", slave, code, address, values[0]))
+    return rtu_frame(struct.pack(f">BBHHB{len(values)}H", slave, code, address, len(values), 2 * len(values), *values))
+
+def rtu_parse(frame: bytes, slave: int, code: int) -> list[int] | int:
+    if len(frame) < 5 or crc16(frame[:-2]) != struct.unpack("<H", frame[-2:])[0]:
+        raise ValueError(f"Invalid Modbus frame: {frame.hex(' ')}")
+    if frame[0] != slave or frame[1] & 0x7F != code:
+        raise ValueError(f"Unexpected Modbus response: slave {frame[0]}, code {frame[1]:#04x}")
+    if frame[1] & 0x80:
+        raise ValueError(f"Modbus exception {frame[2]:#04x}")
+    if code in (0x03, 0x04):
+        return list(struct.unpack(f">{frame[2] // 2}H", frame[3:3 + frame[2]]))
+    return struct.unpack(">H", frame[4:6])[0] if code == 0x10 else 1
+
+def v5_encode(serial: int, sequence: int, control: int, payload: bytes) -> bytes:
+    frame = struct.pack("<BHHHI", V5_START, len(payload), control, sequence, serial) + payload
+    return frame + bytes([sum(frame[1:]) & 0xFF, V5_END])
+
+def v5_decode(frame: bytes) -> tuple[int, int, int, bytes]:
+    if frame[0] != V5_START or frame[-1] != V5_END or sum(frame[1:-2]) & 0xFF != frame[-2]:
+        raise ValueError(f"Invalid V5 frame: {frame.hex(' ')}")
+    _, length, control, sequence, serial = struct.unpack("<BHHHI", frame[:V5_HEADER_SIZE])
+    return control, sequence, serial, frame[V5_HEADER_SIZE:V5_HEADER_SIZE + length]
+
+def backoff(failures: int) -> float:
+    return min(TRANSPORT_BACKOFF_MIN * 2 ** (failures - 1), TRANSPORT_BACKOFF_MAX) * random.uniform(0.5, 1) if failures > 0 else 0
+
+class Connection:
+    def __init__(self, host: str, port: int, serial: int, pipeline: int = TRANSPORT_PIPELINE, auto_reconnect: bool = AUTO_RECONNECT, resolve = None):
+        self.host = host
+        self.port = port
+        self.serial = serial
+        self.pipeline = pipeline
+        self.auto_reconnect = auto_reconnect
+        self.resolve = resolve
+        # Replaced by the Metrics of the first instrumented coordinator using the logger
+        self.metrics = Metrics()
+        # Time of the latest response on the metrics' clock, the device decodes the responses after it
+        self.received = 0.0
+        # RequestTimings of the logger, fed with the round-trip time of every read when attached
+        self.timings = None
+        self.references = 0
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._receiver: asyncio.Task | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._sequence = random.randrange(0x100)
+        self._inflight = 0
+        # Slaves waiting for a pipeline slot in turn order: slave -> waiters
+        self._waiters: dict[int, deque[asyncio.Future]] = {}
+        self._answered: set[int] = set()
+        self._lock = asyncio.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._activity = 0.0
+
+    def __repr__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing() and self._receiver is not None and not self._receiver.done()
+
+    @property
+    def healthy(self) -> bool:
+        return self.connected and monotonic() - self._activity < TRANSPORT_IDLE_TIMEOUT
+
+    async def connect(self) -> None:
+        async with self._lock:
+            if self.healthy:
+                return
+            if self.connected:
+                _LOGGER.debug(f"[{self}] Idle for too long, reconnecting")
+                self._close(ConnectionError("Idle connection"))
+            if (delay := self._retry_at - monotonic()) > 0:
+                raise ConnectionError(f"[{self}] Backing off for {delay:.1f}s after {self._failures} failures")
+            start = self.metrics.start()
+            try:
+                try:
+                    self._reader, self._writer = await self._open()
+                except (OSError, TimeoutError):
+                    if not await self._relocate():
+                        raise
+                    self._reader, self._writer = await self._open()
+            except Exception:
+                self._failures += 1
+                self._retry_at = monotonic() + backoff(self._failures)
+                raise
+            _LOGGER.debug(f"[{self}] Connected")
+            self.metrics.stop("connect", start)
+            self.metrics.count("connects")
+            self._failures = 0
+            self._activity = monotonic()
+            self._receiver = asyncio.get_running_loop().create_task(self._receive())
+
+    async def _open(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), TRANSPORT_CONNECT_TIMEOUT)
+
+    async def _relocate(self) -> bool:
+        # The logger may have got a new address from DHCP, look it up by serial and move the live connection over
+        if self.resolve is None:
+            return False
+        try:
+            host = await self.resolve(self.serial, self.host)
+        except Exception as e:
+            _LOGGER.debug(f"[{self}] Resolving {self.serial} failed: {e!r}")
+            return False
+        if host is None or host == self.host:
+            return False
+        _LOGGER.info(f"[{self}] Logger {self.serial} moved to {host}")
+        if _CONNECTIONS.get((self.host, self.port)) is self:
+            del _CONNECTIONS[(self.host, self.port)]
+            _CONNECTIONS[(host, self.port)] = self
+        self.host = host
+        return True
+
+    async def _receive(self) -> None:
+        try:
+            while True:
+                header = await self._reader.readexactly(V5_HEADER_SIZE)
+                if header[0] != V5_START:
+                    raise ValueError(f"Lost frame synchronization: {header.hex(' ')}")
+                control, sequence, _, payload = v5_decode(header + await self._reader.readexactly(int.from_bytes(header[1:3], "little") + 2))
+                self._activity = monotonic()
+                if control == V5_CONTROL_RESPONSE and (future := self._pending.pop(sequence & 0xFF, None)) is not None and not future.done():
+                    future.set_result(payload[V5_RESPONSE_PREFIX_SIZE:])
+        except Exception as e:
+            self._close(e)
+
+    def _close(self, e: BaseException) -> None:
+        _LOGGER.debug(f"[{self}] Closing: {e!r}")
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"[{self}] Connection closed"))
+        self._pending.clear()
+        if self._writer is not None:
+            self._writer.close()
+        if self._receiver is not None and self._receiver is not asyncio.current_task():
+            self._receiver.cancel()
+        self._reader = self._writer = self._receiver = None
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._close(ConnectionError("Closed"))
+
+    def _next_sequence(self) -> int:
+        self._sequence = (self._sequence + 1) & 0xFF
+        while self._sequence in self._pending:
+            self._sequence = (self._sequence + 1) & 0xFF
+        return self._sequence
+
+    async def _acquire(self, slave: int) -> None:
+        if self._inflight < self.pipeline and not self._waiters:
+            self._inflight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(slave, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            elif (waiters := self._waiters.get(slave)) is not None and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[slave]
+            raise
+
+    def _release(self) -> None:
+        self._inflight -= 1
+        # Slaves sharing the bus take turns, a long poll of one device doesn't hold back the others
+        while self._waiters and self._inflight < self.pipeline:
+            slave = next(iter(self._waiters))
+            future = (waiters := self._waiters.pop(slave)).popleft()
+            if waiters:
+                self._waiters[slave] = waiters
+            if not future.done():
+                self._inflight += 1
+                future.set_result(None)
+
+    async def _request(self, frame: bytes, timeout: float) -> bytes:
+        await self.connect()
+        await self._acquire(frame[0])
+        try:
+            if not self.connected:
+                raise ConnectionError(f"[{self}] Connection closed")
+            sequence = self._next_sequence()
+            future = self._pending[sequence] = asyncio.get_running_loop().create_future()
+            self._writer.write(request := v5_encode(self.serial, sequence, V5_CONTROL_REQUEST, V5_REQUEST_PREFIX + frame))
+            start = self.metrics.start()
+            sent = monotonic()
+            try:
+                await self._writer.drain()
+                response = await asyncio.wait_for(future, timeout)
+                self._answered.add(frame[0])
+                if self.timings is not None and frame[1] in (0x03, 0x04):
+                    self.timings.record(int.from_bytes(frame[4:6], "big"), monotonic() - sent)
+                if self.metrics.enabled:
+                    self.metrics.stop("request", start)
+                    self.received = self.metrics.start()
+                    self.metrics.count("frames")
+                    self.metrics.count("bytes_sent", len(request))
+                    self.metrics.count("bytes_received", len(response))
+                return response
+            except TimeoutError:
+                self.metrics.count("timeouts")
+                self._pending.pop(sequence, None)
+                # A slave that never answered (e.g. switched off) says nothing about the logger
+                if self.pipeline > 1 and frame[0] in self._answered:
+                    # Logger drops pipelined requests, fall back to one request at a time
+                    _LOGGER.debug(f"[{self}] Timeout with {self.pipeline} pipelined requests, disabling pipelining")
+                    self.pipeline = 1
+                raise
+        finally:
+            self._release()
+
+    async def request(self, frame: bytes, timeout: float = TRANSPORT_TIMEOUT, attempts: int = TRANSPORT_ATTEMPTS) -> bytes:
+        for attempt in range(attempts, 0, -1):
+            try:
+                return await self._request(frame, timeout)
+            except (ConnectionError, OSError) as e:
+                if not self.auto_reconnect or attempt == 1:
+                    raise
+                _LOGGER.debug(f"[{self}] Request failed, {attempt - 1} attempts left: {e!r}")
+                self.metrics.count("retries")
+                await asyncio.sleep(max(self._retry_at - monotonic(), 0))
+
+    async def read(self, slave: int, code: int, start: int, end: int) -> list[int]:
+        return rtu_parse(await self.request(rtu_read(slave, code, start, end - start + 1)), slave, code)
+
+    async def write(self, slave: int, code: int, address: int, values: list[int]) -> int:
+        return rtu_parse(await self.request(rtu_write(slave, code, address, values)), slave, code)
+
+# Connections shared by every entry talking to the same logger: (host, port) -> Connection
+_CONNECTIONS: dict[tuple[str, int], Connection] = {}
+
+def acquire_connection(host: str, port: int, serial: int, pipeline: int = TRANSPORT_PIPELINE, resolve = None) -> Connection:
+    if (connection := _CONNECTIONS.get((host, port))) is None:
+        connection = _CONNECTIONS[(host, port)] = Connection(host, port, serial, pipeline, resolve = resolve)
+    elif connection.serial != serial:
+        # Replacing it would leave the entries of the other logger on a second live socket to the same address
+        raise Exception(f"[{connection}] In use by logger {connection.serial}, not {serial}")
+    connection.references += 1
+    return connection
+
+async def release_connection(connection: Connection) -> None:
+    connection.references -= 1
+    if connection.references > 0:
+        return
+    if _CONNECTIONS.get((connection.host, connection.port)) is connection:
+        del _CONNECTIONS[(connection.host, connection.port)]
+    await connection.close()
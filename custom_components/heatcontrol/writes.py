@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+
+from .const import *
+from .common import *
+
+class WriteQueue:
+    def __init__(self, execute, code: int, window: float = TIMINGS_WRITE_WINDOW, max_size: int = WRITE_MAX_SIZE):
+        self._execute = execute
+        self._code = code
+        self._window = window
+        self._max_size = max_size
+        self._pending: list[tuple[int, int, list[int], asyncio.Future]] = []
+        self._flush: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+        # Held while the frames of a window are sent, the next window waits so a later write can't be overtaken
+        self._lock = asyncio.Lock()
+
+    async def write(self, code: int, address: int, registers: list[int] | int) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((code, address, ensure_list(registers), future))
+        if self._flush is None:
+            self._flush = asyncio.get_running_loop().create_task(self._flush_later())
+            self._tasks.add(self._flush)
+            self._flush.add_done_callback(self._tasks.discard)
+        return await future
+
+    async def _flush_later(self) -> None:
+        pending = None
+        try:
+            await asyncio.sleep(self._window)
+            async with self._lock:
+                pending, self._pending, self._flush = self._pending, [], None
+                await self._send(pending)
+        except asyncio.CancelledError:
+            if pending is None:
+                pending, self._pending, self._flush = self._pending, [], None
+            for *_, future in pending:
+                future.cancel()
+            raise
+
+    async def _send(self, pending: list[tuple[int, int, list[int], asyncio.Future]]) -> None:
+        # Only multiple register writes are merged, later writes to the same register supersede earlier ones
+        registers: dict[int, int] = {}
+        others: dict[tuple[int, int], list[int]] = {}
+        for code, address, values, _ in pending:
+            if code == self._code:
+                registers.update(zip(range(address, address + len(values)), values))
+            else:
+                others[(code, address)] = values
+
+        frames = [(c, a, v) for (c, a), v in others.items()]
+        frames.extend((self._code, b[0], [registers[r] for r in b]) for b in group_when(sorted(registers), lambda x, y, z: y - x > 1 or y - z >= self._max_size) if b)
+
+        results = {}
+        for code, address, values in frames:
+            try:
+                results[(code, address)] = await self._execute(code, address = address, registers = values if code == self._code else values[0] if len(values) == 1 else values)
+            except Exception as e:
+                results[(code, address)] = e
+
+        # Each write reports the worst result of the frames covering its registers
+        for code, address, values, future in pending:
+            if future.done():
+                continue
+            covering = [results[(c, a)] for c, a, v in frames if c == code and a <= address + len(values) - 1 and a + len(v) > address]
+            if (e := next((r for r in covering if isinstance(r, Exception)), None)) is not None:
+                future.set_exception(e)
+            else:
+                future.set_result(min(covering))
+
+    def cancel(self) -> None:
+        # Writes not sent yet fail with CancelledError instead of waiting forever
+        for task in self._tasks:
+            task.cancel()
+        # A flush cancelled before it started never runs, its writes are failed here
+        pending, self._pending, self._flush = self._pending, [], None
+        for *_, future in pending:
+            future.cancel()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import standins
+
+# The integration is imported as a bare package, its modules need the Home Assistant development environment
+standins.install()
@@ -0,0 +1,128 @@
+import os
+import sys
+import enum
+import types
+
+# The device stack (device, services and pysolarman) is checked out separately from the integration,
+# the tests and the tools run against these stand-ins when it is missing
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components", "heatcontrol")
+
+class FUNCTION_CODE(enum.IntEnum):
+    READ_COILS = 1
+    READ_DISCRETE_INPUTS = 2
+    READ_HOLDING_REGISTERS = 3
+    READ_INPUT = 4
+    WRITE_SINGLE_COIL = 5
+    WRITE_SINGLE_REGISTER = 6
+    WRITE_MULTIPLE_COILS = 15
+    WRITE_MULTIPLE_REGISTERS = 16
+
+class Device:
+    def __init__(self, config, profile = None):
+        self.config = config
+        self.profile = profile
+        self.device_info = {}
+        self.state = types.SimpleNamespace(value = -1, updated = None)
+
+    async def load(self):
+        return None
+
+    async def get(self, runtime = 0, requests = None):
+        return {}
+
+    async def exe(self, code, address = None, count = None, registers = None):
+        return None
+
+    async def shutdown(self):
+        pass
+
+class ParameterParser:
+    # Decodes responses like the device's parser: key -> (state, raw value)
+    # Registers are read low word first, states are rounded to the digits of the item or else of the profile
+    def __init__(self, items, code = 0x03, digits = 6):
+        self._items = items
+        self._code = code
+        self._digits = digits
+
+    def _read(self, data, definition):
+        code = definition.get("code", self._code)
+        code = code.get("read", self._code) if isinstance(code, dict) else code
+        value = 0
+        for n, r in enumerate(definition["registers"]):
+            block = next((b[r - start] for (c, start), b in data.items() if c == code and start <= r < start + len(b)), None)
+            if block is None:
+                return None
+            value |= (block & 0xFFFF) << (16 * n)
+        return value
+
+    def _signed(self, value, size):
+        return value - (1 << 16 * size) if value >= 1 << 16 * size - 1 else value
+
+    def _scale(self, definition, value):
+        if "offset" in definition:
+            value = value - definition["offset"]
+        if "scale" in definition:
+            value = value * definition["scale"]
+        return value
+
+    def _sensor(self, data, sensor):
+        if (value := self._read(data, sensor)) is None:
+            return None
+        return self._scale(sensor, self._signed(value, len(sensor["registers"])) if "signed" in sensor else value)
+
+    def _composite(self, data, definition):
+        value = 0
+        for s in definition["sensors"]:
+            if (n := self._sensor(data, s)) is None:
+                return None
+            if "multiply" in s:
+                if (m := self._sensor(data, s["multiply"])) is None:
+                    return None
+                n = n * m
+            if (v := s.get("validation")) and (("min" in v and n < v["min"]) or ("max" in v and n > v["max"])):
+                if not "default" in v:
+                    return None
+                n = v["default"]
+            match s.get("operator"):
+                case "subtract":
+                    value = value - n
+                case "multiply":
+                    value = value * n
+                case "divide":
+                    value = value / n if n != 0 else 0
+                case _:
+                    value = value + n
+        return max(value, 0) if "uint" in definition else value
+
+    def _number(self, definition, value):
+        digits = definition.get("digits", self._digits)
+        if isinstance(value, int) or value == int(value):
+            return int(value)
+        if digits < 0:
+            return float(value)
+        return n if (n := round(value, digits)) != int(n) else int(n)
+
+    def process(self, data):
+        result = {}
+        for i in self._items:
+            if "sensors" in i:
+                if (value := self._composite(data, i)) is not None:
+                    result[i["key"]] = (self._number(i, value), None)
+            elif i.get("rule") in (1, 2, 3, 4) and (raw := self._read(data, i)) is not None:
+                raw = self._signed(raw, len(i["registers"])) if i["rule"] in (2, 4) else raw
+                result[i["key"]] = (self._number(i, self._scale(i, raw)), raw)
+        return result
+
+def module(name, **attrs):
+    m = types.ModuleType(name)
+    m.__path__ = []
+    m.__dict__.update(attrs)
+    return m
+
+def install():
+    if not "heatcontrol" in sys.modules:
+        sys.modules["heatcontrol"] = module("heatcontrol", __path__ = [ROOT])
+    for name, attrs in (("services", {}), ("device", { "Device": Device }), ("pysolarman", {}), ("pysolarman.pysolarman", { "FUNCTION_CODE": FUNCTION_CODE })):
+        path = os.path.join(ROOT, *name.split("."))
+        if not f"heatcontrol.{name}" in sys.modules and not os.path.exists(path + ".py") and not os.path.exists(os.path.join(path, "__init__.py")):
+            sys.modules[f"heatcontrol.{name}"] = module(f"heatcontrol.{name}", **attrs)
@@ -0,0 +1,14 @@
+from heatcontrol.attributes import _SHARED_ATTRIBUTES, EMPTY_ATTRIBUTES, acquire_attributes, release_attributes
+
+def test_equal_attributes_are_shared_and_released():
+    a, b = acquire_attributes({"options": ["Off", "On"], "Alt Name": "Mode"}), acquire_attributes({"options": ["Off", "On"], "Alt Name": "Mode"})
+    assert a is b and a["options"] == ("Off", "On")
+    release_attributes(a)
+    assert tuple(b.items()) in _SHARED_ATTRIBUTES
+    release_attributes(b)
+    assert tuple(b.items()) not in _SHARED_ATTRIBUTES
+
+def test_empty_attributes_are_not_counted():
+    assert acquire_attributes({}) is EMPTY_ATTRIBUTES
+    release_attributes(EMPTY_ATTRIBUTES)
+    assert not _SHARED_ATTRIBUTES
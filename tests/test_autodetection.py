@@ -0,0 +1,41 @@
+import asyncio
+
+from heatcontrol import common
+
+class Store:
+    data = {}
+
+    def __init__(self, hass, version, key):
+        self.key = key
+
+    async def async_load(self):
+        return self.data.get(self.key)
+
+    async def async_save(self, data):
+        self.data[self.key] = data
+
+def test_autodetection_is_cached_and_revalidated_later(monkeypatch):
+    monkeypatch.setattr(common, "Store", Store)
+    requests = []
+
+    async def request(runtime, r):
+        requests.append(r)
+        # Deye hybrid, three phases
+        return {(r["code"], r["start"]): [0x0003] + [0] * 7 + [0x0005] + [0] * (r["end"] - r["start"] - 8)}
+
+    async def run():
+        revalidations = []
+        context = common.AUTODETECTION_CONTEXT.set((None, 1234567890, revalidations))
+        try:
+            attr = {"mod": 0, "mppt": 4, "l": 3, "pack": -1}
+            first = await common.lookup_profile(request, dict(attr))
+            detected = len(requests)
+            cached = await common.lookup_profile(request, dict(attr))
+        finally:
+            common.AUTODETECTION_CONTEXT.reset(context)
+        # The cached result is used right away, the device is read again only by the deferred revalidation
+        assert first == cached == "deye_hybrid.yaml" and len(requests) == detected and len(revalidations) == 1
+        await revalidations[0]()
+        assert len(requests) == 2 * detected
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+import os
+import time
+import types
+import asyncio
+
+from homeassistant.util import slugify
+
+import standins
+
+from heatcontrol import coordinator as coordinator_
+from heatcontrol import profile as profile_
+from heatcontrol.metrics import Metrics
+from heatcontrol.timings import RequestTimings
+from heatcontrol.scheduler import Scheduler
+
+PROFILE = os.path.join(os.path.dirname(__file__), "..", "custom_components", "heatcontrol", "inverter_definitions", "deye_hybrid.yaml")
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+
+class Store:
+    def async_delay_save(self, data, delay):
+        pass
+
+def coordinator(polls, latency = 0):
+    device = standins.Device(types.SimpleNamespace(name = "Inverter", serial = 1234567890))
+    polls = iter(polls)
+
+    async def get(runtime = 0, requests = None):
+        await asyncio.sleep(latency)
+        return next(polls)
+
+    device.get = get
+    c = object.__new__(coordinator_.Coordinator)
+    c.__dict__.update(device = device, profile = profile_.freeze_profile(profile_.load_profile(PROFILE, ATTR), ("key",)), data = None, _values = {}, disabled = set(),
+                      hass = None, config_entry = types.SimpleNamespace(entry_id = "entry"), scheduler = None, _realtime_requests = [], _realtime_failures = 0,
+                      metrics = Metrics(), _connection = None, _counter = 0, _update_interval_seconds = 5, _replanned = float("inf"), _timings_saving = True, _timings_store = Store(), timings = RequestTimings(), _revalidations = [])
+    return c
+
+def test_renamed_entity_disabled_after_an_empty_tick_is_excluded(monkeypatch):
+    registry = []
+    monkeypatch.setattr(coordinator_.er, "async_get", lambda hass: None)
+    monkeypatch.setattr(coordinator_.er, "async_entries_for_config_entry", lambda r, entry_id: registry)
+
+    async def run():
+        c = coordinator([{ "io_mode_select": ("Micro Inverter", 2), "generator_power_sensor": (120, 120) }, {}])
+        c.data = await c._async_poll()
+        # Nothing is due on the next tick, the coordinator data holds no values
+        c.data = await c._async_poll()
+        assert c.data == {}
+        unique_id = slugify("Inverter_1234567890_micro_inverter_power_sensor")
+        assert c.unique_keys()[unique_id] == "generator_power_sensor"
+        registry.append(types.SimpleNamespace(unique_id = unique_id, disabled = True))
+        return c.excluded()
+
+    assert "generator_power_sensor" in asyncio.run(run())
+
+def test_polls_feed_the_timings_without_a_transport():
+    async def run():
+        c = coordinator([{}] * 2, .02)
+        c.scheduler = Scheduler({5: [{"code": 3, "start": 0, "end": 9}, {"code": 3, "start": 100, "end": 129}]}, 5, time.monotonic())
+        await c._async_poll()
+        # Nothing due, nothing read
+        await c._async_poll()
+        return c.timings.samples
+
+    samples = asyncio.run(run())
+    assert list(samples) == [20] and samples[20][0] == 1 and .01 <= samples[20][1] < .1
+
+def test_autodetection_is_revalidated_after_the_first_refresh():
+    async def run():
+        c = coordinator([{}])
+        tasks = []
+        c.__dict__.update(name = "Inverter", _lock = asyncio.Lock(), hass = types.SimpleNamespace(async_create_background_task = lambda coro, name: tasks.append(coro)))
+        revalidated = []
+
+        async def revalidate():
+            revalidated.append(True)
+
+        c._revalidations.append(revalidate)
+        await c._async_update_data()
+        await asyncio.gather(*tasks)
+        return c._revalidations, revalidated
+
+    assert asyncio.run(run()) == ([], [True])
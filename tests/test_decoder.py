@@ -0,0 +1,67 @@
+import os
+import random
+
+import pytest
+
+from standins import ParameterParser
+
+from heatcontrol import decoder
+from heatcontrol.common import RegisterMap, get_code
+from heatcontrol.profile import load_profile
+
+DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "custom_components", "heatcontrol", "inverter_definitions")
+PROFILES = sorted(f for f in os.listdir(DIRECTORY) if f.endswith(".yaml"))
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+COMPOSITES = [f for f in PROFILES if any("sensors" in i for i in load_profile(os.path.join(DIRECTORY, f), ATTR)["items"])]
+
+def registers(item):
+    return [r for s in item["sensors"] for p in (s, s.get("multiply")) if p for r in p["registers"]] if "sensors" in item else item["registers"]
+
+def responses(items, rng, missing = .1):
+    # One block per 25 registers of the read items, about one in ten blocks missing
+    registers_ = sorted({(get_code(i, "read", 0x03), r // 25 * 25) for i in items for r in registers(i)})
+    return RegisterMap({k: [rng.randint(0, 0xFFFF) for _ in range(25)] for k in registers_ if rng.random() >= missing})
+
+def parser(profile, items):
+    return ParameterParser(items, profile["code"], profile["default"].get("digits", 6))
+
+@pytest.mark.parametrize("forced", (False, True))
+@pytest.mark.parametrize("file", PROFILES)
+def test_batch_decoder_matches_parser(file, forced, monkeypatch):
+    # Forced, every group is batched whatever its size
+    if forced:
+        monkeypatch.setattr(decoder, "DECODER_GROUP_MIN", 1)
+        monkeypatch.setattr(decoder, "DECODER_BATCH_MIN", 1)
+    profile = load_profile(os.path.join(DIRECTORY, file), ATTR)
+    items = [i for i in profile["items"] if decoder.is_batchable(i)]
+    batch = decoder.BatchDecoder(items, profile["code"], profile["default"].get("digits", 6))
+    data = responses(items, random.Random(file))
+    assert batch.decode(data) == parser(profile, items).process(data)
+
+def test_batch_decoder_rounds_to_digits():
+    profile = load_profile(os.path.join(DIRECTORY, "deye_p3.yaml"), ATTR)
+    items = [i for i in profile["items"] if i["key"] == "battery_bms_charging_voltage_sensor"]
+    # 3 * 0.1 is 0.30000000000000004 unrounded
+    data = RegisterMap({(get_code(items[0], "read", 0x03), items[0]["registers"][0]): [3]})
+    assert decoder.BatchDecoder(items, profile["code"], 6).decode(data) == {"battery_bms_charging_voltage_sensor": (0.3, 3)}
+
+@pytest.mark.parametrize("file", COMPOSITES)
+def test_composite_decoder_matches_parser(file):
+    profile = load_profile(os.path.join(DIRECTORY, file), ATTR)
+    composites = [i for i in profile["items"] if "sensors" in i]
+    compiled = decoder.CompositeDecoder(composites, profile["code"], profile["default"].get("digits", 6))
+    reference = parser(profile, composites)
+    rng = random.Random(file)
+    data = responses(composites, rng, 0)
+    assert compiled.decode(data) == reference.process(data)
+    assert {i["key"]: v for i in composites if (v := decoder.decode_composite(data, i, profile["code"], profile["default"].get("digits", 6))) is not None} == reference.process(data)
+    # Single register changes (including zeros and sign bits) and missing blocks are decoded again incrementally
+    for n in range(64):
+        changed = {k: list(v) for k, v in data.items()}
+        block = rng.choice(list(changed))
+        changed[block][rng.randrange(len(changed[block]))] = rng.choice((0, 1, 0x7FFF, 0x8000, 0xFFFF, rng.randint(0, 0xFFFF)))
+        if n % 8 == 7:
+            del changed[rng.choice(list(changed))]
+        assert compiled.decode(RegisterMap(changed)) == reference.process(changed)
+    compiled.decode(data)
+    assert compiled.decode(data) == reference.process(data) and compiled.evaluated == 0
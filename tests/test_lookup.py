@@ -0,0 +1,34 @@
+import os
+import random
+
+import pytest
+
+from heatcontrol.common import _LOOKUPS, compile_lookup, lookup_compiled, lookup_linear, lookup_value
+from heatcontrol.profile import load_profile
+
+DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "custom_components", "heatcontrol", "inverter_definitions")
+PROFILES = sorted(f for f in os.listdir(DIRECTORY) if f.endswith(".yaml"))
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+
+def values(compiled):
+    table, masks, _ = compiled
+    keys = [k for k in table if isinstance(k, int)] + [m[1] for m in masks]
+    rng = random.Random(len(keys))
+    return sorted({v for k in keys for v in (k, k - 1, k + 1, k | 0x8000)} | set(range(0, 256)) | {rng.randint(0, 0xFFFF) for _ in range(64)})
+
+@pytest.mark.parametrize("file", PROFILES)
+def test_compiled_lookup_matches_linear(file):
+    lookups = [i["lookup"] for i in load_profile(os.path.join(DIRECTORY, file), ATTR)["items"] if i.get("lookup")]
+    for dictionary in lookups:
+        compiled = compile_lookup(dictionary)
+        for v in values(compiled):
+            assert lookup_compiled(v, compiled) == lookup_value(v, dictionary) == lookup_linear(v, dictionary), f"{dictionary}: {v}"
+
+def test_lookup_value_compiles_each_list_once():
+    dictionary = [{"key": 0, "value": "Off"}, {"key": [1, 2], "value": "On"}, {"key": "default", "value": "Unknown"}]
+    assert [lookup_value(v, dictionary) for v in (0, 2, 7)] == ["Off", "On", "Unknown"]
+    compiled = _LOOKUPS[id(dictionary)]
+    lookup_value(1, dictionary)
+    assert _LOOKUPS[id(dictionary)] is compiled
+    # An equal list compiled separately gives the same results
+    assert [lookup_value(v, [dict(o) for o in dictionary]) for v in (0, 2, 7)] == ["Off", "On", "Unknown"]
@@ -0,0 +1,58 @@
+import os
+import types
+import asyncio
+
+import pytest
+
+from heatcontrol import common
+from heatcontrol import profile as profile_
+
+PROFILE = os.path.join(os.path.dirname(__file__), "..", "custom_components", "heatcontrol", "inverter_definitions", "deye_p3.yaml")
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+
+def hass(path):
+    return types.SimpleNamespace(loop = asyncio.get_running_loop(), config = types.SimpleNamespace(path = lambda p: str(path)))
+
+def test_profile_is_shared_and_evicted_when_unreferenced(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_, "TIMINGS_PROFILE_RELEASE", .01)
+
+    async def run():
+        h = hass(tmp_path)
+        a, b = await profile_.async_acquire_profile(h, PROFILE, ATTR), await profile_.async_acquire_profile(h, PROFILE, ATTR)
+        assert a is b
+        profile_.release_profile(h, a)
+        profile_.release_profile(h, b)
+        # Reacquired within the grace period, the profile is reused
+        assert await profile_.async_acquire_profile(h, PROFILE, ATTR) is a
+        await asyncio.sleep(.05)
+        assert a["key"] in profile_._PROFILES
+        profile_.release_profile(h, a)
+        await asyncio.sleep(.05)
+        assert a["key"] not in profile_._PROFILES
+
+    asyncio.run(run())
+
+def test_profile_is_frozen_deeply():
+    profile = profile_.freeze_profile(profile_.load_profile(PROFILE, ATTR), ("key",))
+    with pytest.raises(TypeError):
+        profile["items"][0]["name"] = "Renamed"
+    with pytest.raises(TypeError):
+        profile["default"]["update_interval"] = 1
+    with pytest.raises(TypeError):
+        profile["requests"][0]["start"] = 1
+    assert all(isinstance(r, tuple) for r in profile["schedule"].values())
+
+def test_yaml_open_reads_through_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(common, "_YAML_CACHE", None)
+    parsed = asyncio.run(common.yaml_open(PROFILE))
+    common.set_yaml_cache(str(tmp_path))
+    assert asyncio.run(common.yaml_open(PROFILE)) == parsed
+    # Later reads, like the device's parser on setup, don't parse the file again
+    monkeypatch.setattr(common.yaml, "safe_load", None)
+    assert asyncio.run(common.yaml_open(PROFILE)) == parsed
+
+def test_plans_are_built_on_the_first_load_and_cached(tmp_path, monkeypatch):
+    profile = profile_.load_profile(PROFILE, ATTR, str(tmp_path))
+    monkeypatch.setattr(profile_, "plan_schedule", None)
+    cached = profile_.load_profile(PROFILE, ATTR, str(tmp_path))
+    assert (cached["schedule"], cached["realtime"]) == (profile["schedule"], profile["realtime"])
@@ -0,0 +1,25 @@
+import random
+
+from heatcontrol.common import RegisterMap, get_addr_value, register_map
+
+def scan(data, code, addr):
+    for (c, start), block in data.items():
+        if c == code and start <= addr < start + len(block):
+            return block[addr - start]
+    return None
+
+def test_plain_responses_match_the_linear_scan():
+    rng = random.Random(1)
+    for _ in range(20):
+        # Overlapping blocks on two codes, the first block covering an address wins
+        data = {(rng.choice((3, 4)), rng.randrange(0, 200)): [rng.randint(0, 0xFFFF) for _ in range(rng.randrange(1, 40))] for _ in range(rng.randrange(1, 16))}
+        assert [get_addr_value(data, c, a) for c in (3, 4) for a in range(260)] == [scan(data, c, a) for c in (3, 4) for a in range(260)]
+
+def test_plain_responses_are_wrapped_once_per_poll():
+    data = {(3, 10 * n): [n, n] for n in range(8)}
+    wrapped = register_map(data)
+    assert isinstance(wrapped, RegisterMap) and register_map(data) is wrapped
+    # Blocks added to the responses are indexed again
+    data[(3, 80)] = [8]
+    assert get_addr_value(data, 3, 80) == 8 and register_map(data) is not wrapped
+    assert register_map(wrapped) is wrapped
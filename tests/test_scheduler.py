@@ -0,0 +1,41 @@
+from heatcontrol.scheduler import Scheduler
+
+FAST = {"code": 3, "start": 0, "end": 9}
+SLOW = {"code": 3, "start": 100, "end": 109}
+
+def reads(schedule, tick, step, until, request):
+    scheduler, now, times = Scheduler(schedule, tick, 0.0), 0.0, []
+    while now < until:
+        times.extend(now for e in scheduler.due(now) if e[4] is request)
+        now += step
+    return times
+
+def test_every_tick_request_is_read_every_tick():
+    assert len(reads({5: [FAST]}, 5, 5, 60, FAST)) == 12
+
+def test_early_read_is_not_repeated_on_next_tick():
+    # Polls taking 0.3s make the coordinator tick every 5.3s, the slow group fires up to half a tick early
+    times = reads({5: [FAST], 60: [SLOW]}, 5, 5.3, 3600, SLOW)
+    assert all(b - a > 5.3 * 2 for a, b in zip(times, times[1:]))
+    assert len(times) == 3600 // 60 + 1
+
+def test_retry_keeps_phase():
+    scheduler = Scheduler({60: [SLOW]}, 5, 0.0)
+    entries = scheduler.due(0.0)
+    scheduler.retry(entries, 0.0)
+    assert Scheduler.requests(scheduler.due(5.0)) == [SLOW]
+    assert scheduler.due(10.0) == []
+    assert Scheduler.requests(scheduler.due(60.0)) == [SLOW]
+
+def test_replace_keeps_deadlines_and_slips():
+    scheduler = Scheduler({5: [FAST], 60: [SLOW]}, 5, 0.0)
+    scheduler.due(0.0)
+    scheduler.due(20.0)
+    slips = scheduler.slips
+    # SLOW is split in two, both halves stay on its phase, the new request is read right away
+    first, second, new = {"code": 3, "start": 100, "end": 104}, {"code": 3, "start": 105, "end": 109}, {"code": 3, "start": 200, "end": 209}
+    scheduler.replace({5: [FAST], 60: [first, second, new]}, 22.0)
+    assert Scheduler.requests(scheduler.due(22.0)) == [new]
+    assert Scheduler.requests(scheduler.due(25.0)) == [FAST]
+    assert sorted(r["start"] for r in Scheduler.requests(scheduler.due(60.0)) if r is not FAST) == [100, 105]
+    assert scheduler.slips is slips and (3, 0, 9) in slips
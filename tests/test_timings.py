@@ -0,0 +1,33 @@
+import os
+
+from heatcontrol.timings import RequestTimings
+from heatcontrol.profile import load_profile, replan_schedule
+
+PROFILE = os.path.join(os.path.dirname(__file__), "..", "custom_components", "heatcontrol", "inverter_definitions", "sofar_g3hyd.yaml")
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+
+def learned(overhead, per_register):
+    timings = RequestTimings()
+    for size in (1, 10, 50, 125) * 10:
+        timings.record(size, overhead + per_register * size)
+    return timings
+
+def test_model_needs_enough_samples():
+    timings = RequestTimings()
+    timings.record(10, .2)
+    assert timings.model() is None
+
+def test_model_fits_overhead_and_per_register_cost():
+    overhead, per_register = learned(.3, .001).model()
+    assert abs(overhead - .3) < 1e-9 and abs(per_register - .001) < 1e-9
+
+def test_samples_survive_storage():
+    timings = learned(.3, .001)
+    assert RequestTimings(timings.as_dict()).model() == timings.model()
+
+def test_replan_uses_learned_timings():
+    profile = load_profile(PROFILE, ATTR)
+    assert replan_schedule(profile, profile["items"], set(), RequestTimings()) == (dict(profile["schedule"]), profile["realtime"])
+    # With a high per request overhead gaps are cheaper to read than another request
+    schedule, _ = replan_schedule(profile, profile["items"], set(), learned(1, .0001))
+    assert sum(len(r) for r in schedule.values()) < sum(len(r) for r in profile["schedule"].values())
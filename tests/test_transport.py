@@ -0,0 +1,165 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+
+import simulator
+
+from heatcontrol import transport
+
+PROFILE = os.path.join(os.path.dirname(__file__), "..", "custom_components", "heatcontrol", "inverter_definitions", "deye_p3.yaml")
+SERIAL = 1234567890
+
+async def logger(latency = 0.0):
+    loggers, servers = await simulator.serve(PROFILE, [SERIAL], latency, 0, 0, "127.0.0.1", 0)
+    return loggers[0], servers[0], servers[0].sockets[0].getsockname()[1]
+
+def expected(logger, code, start, end):
+    return [logger.registers.get(code, {}).get(r, 0) for r in range(start, end + 1)]
+
+def test_responses_are_matched_to_their_requests():
+    async def run():
+        log, server, port = await logger()
+        connection = transport.Connection("127.0.0.1", port, SERIAL)
+        try:
+            blocks = [(3, s, s + n) for s, n in ((0x00, 20), (0x3C, 10), (0x96, 50), (0x258, 3), (0x00, 0))] * 3
+            assert await asyncio.gather(*(connection.read(1, *b) for b in blocks)) == [expected(log, *b) for b in blocks]
+        finally:
+            await connection.close()
+            server.close()
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize("pipeline", (1, 4))
+def test_requests_are_pipelined_up_to_the_limit(pipeline):
+    async def run():
+        log, server, port = await logger(.1)
+        connection = transport.Connection("127.0.0.1", port, SERIAL, pipeline)
+        try:
+            reads = asyncio.gather(*(connection.read(1, 3, 0, 9) for _ in range(6)))
+            await asyncio.sleep(.05)
+            # Sent before the first response arrives
+            sent = log.requests
+            await reads
+            return sent
+        finally:
+            await connection.close()
+            server.close()
+
+    assert asyncio.run(run()) == pipeline
+
+def test_dropped_pipelined_requests_turn_pipelining_off():
+    async def run():
+        log, server, port = await logger()
+        connection = transport.Connection("127.0.0.1", port, SERIAL, 4)
+        try:
+            await connection.read(1, 3, 0, 9)
+            log.drop = 1
+            with pytest.raises(TimeoutError):
+                await connection.request(transport.rtu_read(1, 3, 0, 10), .1, 1)
+            log.drop = 0
+            return connection.pipeline, await connection.read(1, 3, 0, 9) == expected(log, 3, 0, 9)
+        finally:
+            await connection.close()
+            server.close()
+
+    assert asyncio.run(run()) == (1, True)
+
+def test_unanswered_slave_keeps_pipelining():
+    async def run():
+        log, server, port = await logger()
+        connection = transport.Connection("127.0.0.1", port, SERIAL, 4)
+        try:
+            log.drop = 1
+            with pytest.raises(TimeoutError):
+                await connection.request(transport.rtu_read(2, 3, 0, 10), .1, 1)
+            return connection.pipeline
+        finally:
+            await connection.close()
+            server.close()
+
+    assert asyncio.run(run()) == 4
+
+def test_failed_connects_back_off(monkeypatch):
+    monkeypatch.setattr(transport, "TRANSPORT_BACKOFF_MIN", .2)
+
+    async def run():
+        log, server, port = await logger()
+        server.close()
+        await server.wait_closed()
+        connection = transport.Connection("127.0.0.1", port, SERIAL)
+        with pytest.raises(OSError):
+            await connection.connect()
+        # Refused without a connection attempt until the backoff has passed
+        with pytest.raises(ConnectionError, match = "Backing off"):
+            await connection.connect()
+        assert transport.backoff(2) <= .4 and transport.backoff(10) <= transport.TRANSPORT_BACKOFF_MAX
+        await asyncio.sleep(.25)
+        with pytest.raises(OSError) as e:
+            await connection.connect()
+        return e.value, connection._failures
+
+    error, failures = asyncio.run(run())
+    assert not "Backing off" in str(error) and failures == 2
+
+def test_connections_are_shared_per_logger_address():
+    async def run():
+        a = transport.acquire_connection("127.0.0.1", 18899, SERIAL)
+        b = transport.acquire_connection("127.0.0.1", 18899, SERIAL)
+        try:
+            assert a is b and a.references == 2
+            # Another logger can't take over the address of a live connection
+            with pytest.raises(Exception, match = "In use"):
+                transport.acquire_connection("127.0.0.1", 18899, SERIAL + 1)
+            assert transport.acquire_connection("127.0.0.1", 18900, SERIAL + 1) is not a
+        finally:
+            for c in (a, b, transport._CONNECTIONS[("127.0.0.1", 18900)]):
+                await transport.release_connection(c)
+        assert transport._CONNECTIONS == {}
+
+    asyncio.run(run())
+
+def test_slaves_sharing_a_connection_take_turns():
+    async def run():
+        log, server, port = await logger(.01)
+        served, execute = [], log.execute
+        log.execute = lambda frame: served.append(frame[0]) or execute(frame)
+        # Entries of two slaves behind the same logger
+        a, b = transport.acquire_connection("127.0.0.1", port, SERIAL, 1), transport.acquire_connection("127.0.0.1", port, SERIAL, 1)
+        try:
+            assert a is b
+            await asyncio.gather(*(a.read(1, 3, 0, 9) for _ in range(4)), *(b.read(2, 3, 0, 9) for _ in range(4)))
+        finally:
+            await transport.release_connection(a)
+            await transport.release_connection(b)
+            server.close()
+        return served
+
+    # The first request of slave 1 goes out at once, the others alternate
+    assert asyncio.run(run()) == [1, 1, 2, 1, 2, 1, 2, 2]
+
+def test_connection_follows_a_relocated_logger():
+    async def run():
+        log, server, port = await logger()
+        resolved = []
+
+        async def resolve(serial, host):
+            resolved.append((serial, host))
+            return "127.0.0.1"
+
+        # The logger got a new address, nothing listens on the old one
+        connection = transport.acquire_connection("127.0.0.2", port, SERIAL, resolve = resolve)
+        try:
+            assert await connection.read(1, 3, 0, 9) == expected(log, 3, 0, 9)
+            return resolved, connection.host, list(transport._CONNECTIONS)
+        finally:
+            await transport.release_connection(connection)
+            server.close()
+
+    resolved, host, connections = asyncio.run(run())
+    assert resolved == [(SERIAL, "127.0.0.2")] and host == "127.0.0.1"
+    # The pooled connection moved with it
+    assert connections == [("127.0.0.1", connections[0][1])] and transport._CONNECTIONS == {}
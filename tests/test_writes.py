@@ -0,0 +1,55 @@
+import asyncio
+
+from heatcontrol.writes import WriteQueue
+
+class Device:
+    def __init__(self, latency = 0.0, fail = ()):
+        self.frames = []
+        self.latency = latency
+        self.fail = fail
+        self.lock = asyncio.Lock()
+
+    async def exe(self, code, address = None, registers = None):
+        # Frames are sent one at a time, like on the logger connection
+        async with self.lock:
+            await asyncio.sleep(self.latency)
+            if address in self.fail:
+                raise Exception(f"Write to {address} failed")
+            self.frames.append((address, registers))
+            return 1
+
+def test_writes_in_window_are_merged():
+    async def run():
+        device = Device()
+        queue = WriteQueue(device.exe, 0x10, .01)
+        assert await asyncio.gather(queue.write(0x10, 10, [1]), queue.write(0x10, 11, [2]), queue.write(0x10, 10, [3])) == [1, 1, 1]
+        return device.frames
+    assert asyncio.run(run()) == [(10, [3, 2])]
+
+def test_later_window_is_not_overtaken():
+    async def run():
+        # The second window closes while the first one is still sending
+        device = Device(.12)
+        queue = WriteQueue(device.exe, 0x10, .05)
+        first = asyncio.ensure_future(asyncio.gather(queue.write(0x10, 100, [1]), queue.write(0x10, 300, [1])))
+        await asyncio.sleep(.1)
+        await asyncio.gather(first, queue.write(0x10, 300, [2]))
+        return device.frames
+    assert asyncio.run(run()) == [(100, [1]), (300, [1]), (300, [2])]
+
+def test_failed_frame_fails_covering_writes():
+    async def run():
+        device = Device(fail = (20,))
+        queue = WriteQueue(device.exe, 0x10, .01)
+        return await asyncio.gather(queue.write(0x10, 10, [1]), queue.write(0x10, 20, [1]), return_exceptions = True)
+    first, second = asyncio.run(run())
+    assert first == 1 and isinstance(second, Exception)
+
+def test_cancel_fails_pending_writes():
+    async def run():
+        queue = WriteQueue(Device().exe, 0x10, 10)
+        write = asyncio.ensure_future(queue.write(0x10, 10, [1]))
+        await asyncio.sleep(0)
+        queue.cancel()
+        return await asyncio.wait_for(asyncio.gather(write, return_exceptions = True), 1)
+    assert isinstance(asyncio.run(run())[0], asyncio.CancelledError)
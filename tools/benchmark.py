@@ -0,0 +1,212 @@
+#
+# Command: py benchmark.py {path} {repeat} {output}
+# Example: py benchmark.py "..\custom_components\heatcontrol\inverter_definitions" 100 benchmark.json
+# path:    Profile or directory of profiles
+# repeat:  Number of timed iterations
+# output:  Optional JSON file the results are written to, compare the files of two versions to spot regressions
+#
+# Requires the Home Assistant development environment (the integration modules are imported directly)
+# Modules of the device stack that are not checked out are replaced by the stand-ins in tests/standins.py
+#
+
+import os
+import sys
+import copy
+import json
+import yaml
+import types
+import random
+import timeit
+import asyncio
+import platform
+import tempfile
+import importlib
+
+# The device stack is stood in by the test stand-ins when it is not checked out
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests"))
+
+import standins
+
+def load(module):
+    standins.install()
+    return importlib.import_module(f"heatcontrol.{module}")
+
+common = load("common")
+profile_ = load("profile")
+decoder = load("decoder")
+
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+
+def items(profile, attr = ATTR):
+    table = {r: common.get_request_code(pr) for pr in profile["requests"] for r in range(pr["start"], pr["end"] + 1)} if "requests" in profile else {}
+    code = profile.get("default", {}).get("code", 0x03)
+    return [i for i in [common.process_descriptions(item, group, table, code, attr["mod"]) for group in profile["parameters"] for item in group["items"]] if len((a := i.keys() & attr.keys())) == 0 or ((k := next(iter(a))) and i[k] <= attr[k])]
+
+def poll(items, code = 0x03, span = 25, max_size = 125):
+    registers = sorted({(common.get_code(i, "read", code), r) for i in items if "rule" in i and i["rule"] > 0 and "registers" in i for r in i["registers"]})
+    responses = {}
+    for g in common.group_when(registers, lambda x, y, z: x[0] != y[0] or y[1] - x[1] > span or y[1] - z[1] >= max_size):
+        if len(g) > 0:
+            responses[(g[0][0], g[0][1])] = [random.randint(0, 0xFFFF) for _ in range(g[-1][1] - g[0][1] + 1)]
+    return responses
+
+def scan(data, code, addr):
+    # Linear scan of the blocks, as get_addr_value read plain responses before they were indexed
+    for (c, start), block in data.items():
+        if c == code and start <= addr < start + len(block):
+            return block[addr - start]
+    return None
+
+def decode(data, items, code = 0x03, get = common.get_addr_value):
+    return [get(data, common.get_code(i, "read", code), r) for i in items if "rule" in i and i["rule"] > 0 and "registers" in i for r in i["registers"]]
+
+def ms(seconds):
+    return round(seconds * 1000, 4)
+
+def bench_yaml_open(file, repeat):
+    parse = timeit.timeit(lambda: asyncio.run(common.yaml_open(file)), number = repeat) / repeat
+    profile = asyncio.run(common.yaml_open(file))
+    # process_descriptions modifies the items in place, every iteration gets its own copy
+    copies = iter([copy.deepcopy(profile) for _ in range(repeat)])
+    process = timeit.timeit(lambda: items(next(copies)), number = repeat) / repeat
+    print(f"yaml_open: {parse * 1000:.3f}ms, process_descriptions: {process * 1000:.3f}ms")
+    return { "yaml_open_ms": ms(parse), "process_descriptions_ms": ms(process) }
+
+def bench_planning(file, repeat):
+    profile = profile_.load_profile(file, ATTR)
+    plan = lambda: profile_.plan_requests(profile["items"], profile["code"], profile[common.IS_SINGLE_CODE], profile[common.REQUEST_MIN_SPAN], profile[common.REQUEST_MAX_SIZE])
+    schedule = lambda: profile_.replan_schedule(profile, profile["items"], set())
+    planned, scheduled = timeit.timeit(plan, number = repeat) / repeat, timeit.timeit(schedule, number = repeat) / repeat
+    print(f"group_when: {len(plan())} requests, plan: {planned * 1000:.3f}ms, schedule: {scheduled * 1000:.3f}ms")
+    return { "requests": len(plan()), "plan_ms": ms(planned), "schedule_ms": ms(scheduled) }
+
+def bench_register_map(items, repeat):
+    responses = poll(items)
+    assert decode(responses, items, get = scan) == decode(dict(responses), items) == decode(common.RegisterMap(responses), items)
+    linear = timeit.timeit(lambda: decode(responses, items, get = scan), number = repeat) / repeat
+    # Every poll builds new responses, indexed once on the first lookup when they have enough blocks
+    indexed = timeit.timeit(lambda: decode(dict(responses), items), number = repeat) / repeat
+    print(f"get_addr_value: {len(responses)} blocks, linear: {linear * 1000:.3f}ms, indexed: {indexed * 1000:.3f}ms, x{linear / indexed:.1f}")
+    return { "blocks": len(responses), "linear_ms": ms(linear), "indexed_ms": ms(indexed) }
+
+def bench_profile_load(file, repeat):
+    with tempfile.TemporaryDirectory() as cache:
+        parsed = timeit.timeit(lambda: profile_.load_profile(file, ATTR), number = repeat) / repeat
+        profile_.load_profile(file, ATTR, cache)
+        assert profile_.load_profile(file, ATTR, cache) == profile_.load_profile(file, ATTR)
+        cached = timeit.timeit(lambda: profile_.load_profile(file, ATTR, cache), number = repeat) / repeat
+    print(f"load_profile: parsed: {parsed * 1000:.3f}ms, cached: {cached * 1000:.3f}ms, x{parsed / cached:.1f}")
+    return { "parsed_ms": ms(parsed), "cached_ms": ms(cached) }
+
+def bench_decoder(items, repeat):
+    data = common.RegisterMap(poll(items))
+    batchable = [i for i in items if decoder.is_batchable(i)]
+    per_item = lambda: {i["key"]: v for i in batchable if (v := decoder.decode_item(data, i)) is not None}
+    batch = decoder.BatchDecoder(batchable)
+    assert per_item() == batch.decode(data)
+    single = timeit.timeit(per_item, number = repeat) / repeat
+    batched = timeit.timeit(lambda: batch.decode(data), number = repeat) / repeat
+    print(f"decode: {len(batchable)}/{len(items)} items, {len(batchable) - len(batch.items)} in {len(batch.groups)} groups, per item: {single * 1000:.3f}ms, batched: {batched * 1000:.3f}ms, x{single / batched:.1f}")
+    return { "items": len(batchable), "per_item_ms": ms(single), "batched_ms": ms(batched) }
+
+def bench_composites(items, repeat):
+    composites = [i for i in items if "sensors" in i]
+    if not composites:
+        return None
+    reference = lambda data: {i["key"]: v for i in composites if (v := decoder.decode_composite(data, i)) is not None}
+    compiled = decoder.CompositeDecoder(composites)
+    data = common.RegisterMap(poll(items))
+    assert reference(data) == compiled.decode(data)
+    # Unchanged, single register changes (including zeros and sign bits) and missing blocks have to match the interpretation
+    for n in range(64):
+        responses = { k: list(v) for k, v in data.items() }
+        block = random.choice(list(responses))
+        responses[block][random.randrange(len(responses[block]))] = random.choice((0, 1, 0x7FFF, 0x8000, 0xFFFF, random.randint(0, 0xFFFF)))
+        if n % 8 == 7:
+            del responses[random.choice(list(responses))]
+        changed = common.RegisterMap(responses)
+        assert reference(changed) == compiled.decode(changed), f"{responses}"
+    compiled.decode(data)
+    interpreted = timeit.timeit(lambda: reference(data), number = repeat) / repeat
+    unchanged = timeit.timeit(lambda: compiled.decode(data), number = repeat) / repeat
+    assert compiled.evaluated == 0
+    polls = [common.RegisterMap(poll(items)) for _ in range(repeat)]
+    # The per code values of every map are built up front, like the one read by the interpretation
+    for p in polls:
+        p.values_by_code
+    changing = iter(polls)
+    changed = timeit.timeit(lambda: compiled.decode(next(changing)), number = repeat) / repeat
+    print(f"composites: {len(composites)} items on {len(compiled.dependents)} registers, interpreted: {interpreted * 1000:.3f}ms, compiled: {changed * 1000:.3f}ms, unchanged: {unchanged * 1000:.3f}ms, x{interpreted / unchanged:.1f}")
+    return { "items": len(composites), "interpreted_ms": ms(interpreted), "compiled_ms": ms(changed), "unchanged_ms": ms(unchanged) }
+
+def bench_get_number(items, repeat):
+    values = [v for v, _ in decoder.BatchDecoder([i for i in items if decoder.is_batchable(i)]).decode(common.RegisterMap(poll(items))).values()]
+    digits = [random.choice((-1, 0, 1, 2, 3)) for _ in values]
+    numbers = timeit.timeit(lambda: [common.get_number(v, d) for v, d in zip(values, digits)], number = repeat) / repeat
+    print(f"get_number: {len(values)} values, {numbers * 1000:.3f}ms")
+    return { "values": len(values), "get_number_ms": ms(numbers) }
+
+def bench_create_entity(items, repeat):
+    entity = load("entity")
+    device = types.SimpleNamespace(config = types.SimpleNamespace(name = "Inverter", serial = 1234567890), device_info = {}, state = types.SimpleNamespace(value = 1))
+    coordinator = types.SimpleNamespace(device = device, data = {}, profile = None, hass = None, last_update_success = True)
+    descriptions = [i for i in items if "registers" in i and not "configurable" in i]
+    created = timeit.timeit(lambda: [entity.create_entity(lambda x: entity.SolarmanEntity(coordinator, x), d) for d in descriptions], number = repeat) / repeat
+    print(f"create_entity: {len(descriptions)} entities, {created * 1000:.3f}ms")
+    return { "entities": len(descriptions), "create_entity_ms": ms(created) }
+
+def bench_lookups(items, repeat):
+    lookups = [(i["lookup"], common.compile_lookup(i["lookup"])) for i in items if i.get("lookup")]
+    values = []
+    for dictionary, (table, masks, _) in lookups:
+        keys = [k for k in table if isinstance(k, int)] + [m[1] for m in masks]
+        values.append(sorted({v for k in keys for v in (k, k - 1, k + 1, k | 0x8000)} | set(range(0, 256)) | {random.randint(0, 0xFFFF) for _ in range(64)}))
+    for (dictionary, compiled), vs in zip(lookups, values):
+        for v in vs:
+            assert common.lookup_linear(v, dictionary) == common.lookup_compiled(v, compiled), f"{dictionary}: {v}"
+    if lookups:
+        linear = timeit.timeit(lambda: [common.lookup_linear(v, d) for (d, _), vs in zip(lookups, values) for v in vs], number = repeat) / repeat
+        compiled = timeit.timeit(lambda: [common.lookup_value(v, d) for (d, _), vs in zip(lookups, values) for v in vs], number = repeat) / repeat
+        print(f"lookup_value: {len(lookups)} lookups, {sum(len(vs) for vs in values)} values, linear: {linear * 1000:.3f}ms, compiled: {compiled * 1000:.3f}ms, x{linear / compiled:.1f}")
+        return { "lookups": len(lookups), "linear_ms": ms(linear), "compiled_ms": ms(compiled) }
+    return None
+
+def run(file, repeat):
+    with open(file) as f:
+        profile = yaml.safe_load(f)
+
+    print(f"{os.path.basename(file)}:")
+
+    return {
+        "yaml_open": bench_yaml_open(file, max(repeat // 10, 1)),
+        "load_profile": bench_profile_load(file, max(repeat // 10, 1)),
+        "planning": bench_planning(file, repeat),
+        "register_map": bench_register_map(items(profile), repeat),
+        "decode": bench_decoder(items(profile), repeat),
+        "composites": bench_composites(items(profile), repeat),
+        "lookup_value": bench_lookups([i for g in profile["parameters"] for i in g["items"]], max(repeat // 10, 1)),
+        "get_number": bench_get_number(items(profile), repeat),
+        "create_entity": bench_create_entity(items(profile), max(repeat // 10, 1))
+    }
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print("File not provided!")
+        sys.exit()
+
+    file = sys.argv[1]
+
+    if not os.path.exists(file):
+        print("File does not exist!")
+        sys.exit()
+
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isnumeric() else 100
+    output = sys.argv[3] if len(sys.argv) > 3 else None
+
+    results = { os.path.basename(f): run(f, repeat) for f in sorted(os.path.join(file, f) for f in os.listdir(file) if f.endswith(".yaml")) } if os.path.isdir(file) else { os.path.basename(file): run(file, repeat) }
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({ "python": platform.python_version(), "repeat": repeat, "results": results }, f, indent = 2)
+        print(f"Results written to {output}")
@@ -0,0 +1,105 @@
+#
+# Command: py loadtest.py {path} {devices} {duration} {interval} {latency} {jitter} {drop}
+# Example: py loadtest.py "..\custom_components\heatcontrol\inverter_definitions\deye_p3.yaml" 10 60 5 0.05 0.02 0.01
+# devices:  Number of simulated loggers and coordinators polling them
+# duration: Test duration in seconds
+# interval: Poll interval in seconds
+#
+# Starts simulator.py in a separate process so the reported CPU time covers the polling side only
+# Requires the Home Assistant development environment (the integration modules are imported directly)
+#
+
+import os
+import sys
+import time
+import types
+import asyncio
+import importlib
+import statistics
+
+def load(module):
+    if not "heatcontrol" in sys.modules:
+        package = types.ModuleType("heatcontrol")
+        package.__path__ = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components", "heatcontrol")]
+        sys.modules["heatcontrol"] = package
+    return importlib.import_module(f"heatcontrol.{module}")
+
+transport = load("transport")
+profile_ = load("profile")
+
+HOST = "127.0.0.1"
+PORT = 8899
+SERIAL = 1234567890
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+
+class Poller:
+    def __init__(self, connection, requests, interval):
+        self.connection = connection
+        self.requests = requests
+        self.interval = interval
+        self.latencies = []
+        self.failures = 0
+
+    async def poll(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*(self.connection.read(1, r["code"], r["start"], r["end"]) for r in self.requests))
+            self.latencies.append(time.perf_counter() - start)
+        except Exception:
+            self.failures += 1
+
+    async def run(self, until):
+        while (now := time.monotonic()) < until:
+            await self.poll()
+            await asyncio.sleep(max(self.interval - (time.monotonic() - now), 0))
+
+def percentile(values, p):
+    return statistics.quantiles(values, n = 100)[p - 1] if len(values) > 1 else (values[0] if values else 0)
+
+async def main(file, devices, duration, interval, latency, jitter, drop):
+    simulator = await asyncio.create_subprocess_exec(sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator.py"), file, ','.join(str(SERIAL + n) for n in range(devices)), str(latency), str(jitter), str(drop), stdout = asyncio.subprocess.DEVNULL)
+
+    try:
+        await asyncio.sleep(1 + devices / 50)
+
+        requests = profile_.load_profile(file, ATTR)["requests"]
+        pollers = [Poller(transport.acquire_connection(HOST, PORT + n, SERIAL + n), requests, interval) for n in range(devices)]
+
+        cpu, start = time.process_time(), time.monotonic()
+        await asyncio.gather(*(p.run(start + duration) for p in pollers))
+        cpu, elapsed = time.process_time() - cpu, time.monotonic() - start
+
+        for p in pollers:
+            await transport.release_connection(p.connection)
+
+        latencies = [l for p in pollers for l in p.latencies]
+        polls = len(latencies)
+
+        print(f"{os.path.basename(file)}: {devices} devices, {len(requests)} requests per poll, {elapsed:.1f}s")
+        print(f"Throughput: {polls / elapsed:.2f} polls/s, {polls * len(requests) / elapsed:.2f} requests/s, {sum(p.failures for p in pollers)} failed polls")
+        print(f"Poll latency: p50 {percentile(latencies, 50) * 1000:.1f}ms, p99 {percentile(latencies, 99) * 1000:.1f}ms")
+        print(f"CPU: {cpu / devices * 1000:.1f}ms per device, {cpu / max(polls, 1) * 1000:.3f}ms per poll")
+    finally:
+        simulator.terminate()
+        await simulator.wait()
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print("File not provided!")
+        sys.exit()
+
+    file = sys.argv[1]
+
+    if not os.path.isfile(file):
+        print("File does not exist!")
+        sys.exit()
+
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 60
+    interval = float(sys.argv[4]) if len(sys.argv) > 4 else 5
+    latency = float(sys.argv[5]) if len(sys.argv) > 5 else 0.05
+    jitter = float(sys.argv[6]) if len(sys.argv) > 6 else 0.02
+    drop = float(sys.argv[7]) if len(sys.argv) > 7 else 0
+
+    asyncio.run(main(file, devices, duration, interval, latency, jitter, drop))
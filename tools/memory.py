@@ -0,0 +1,84 @@
+#
+# Command: py memory.py {path} {devices} {disabled}
+# Example: py memory.py "..\custom_components\heatcontrol\inverter_definitions\deye_p3.yaml" 20 50
+# path:     Profile or directory of profiles
+# devices:  Number of devices using the profile
+# disabled: Optional share (%) of the items disabled in the entity registry, on top of the ones the profile disables
+#
+# Builds the real entity objects (SolarmanEntity) of the profile items for N devices on a stand-in coordinator
+# and reports the memory they hold and the time to build them, the descriptions themselves are loaded once and not counted
+# Disabled items are only registered and never built, the skipped ones are compared against building every item
+# Run it on two checkouts to compare entity layouts
+# Requires the Home Assistant development environment (the integration modules are imported directly)
+#
+
+import os
+import sys
+import time
+import types
+import tracemalloc
+import importlib
+
+def load(module):
+    if not "heatcontrol" in sys.modules:
+        package = types.ModuleType("heatcontrol")
+        package.__path__ = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components", "heatcontrol")]
+        sys.modules["heatcontrol"] = package
+    return importlib.import_module(f"heatcontrol.{module}")
+
+entity = load("entity")
+profile_ = load("profile")
+
+ATTR = {"mod": 1, "mppt": 4, "l": 3, "pack": 1}
+
+def coordinator(serial):
+    config = types.SimpleNamespace(name = "Inverter", serial = serial)
+    return types.SimpleNamespace(device = types.SimpleNamespace(config = config, device_info = {serial: {"identifiers": {("heatcontrol", serial)}}}), profile = None, data = {})
+
+def measure(items, devices):
+    coordinators = [coordinator(1000 + i) for i in range(devices)]
+    # One device is built first so growing the interpreter's interned strings (once per process) is not counted
+    warmup = [entity.SolarmanEntity(coordinator(999), item) for item in items]
+    tracemalloc.start()
+    kept = [[entity.SolarmanEntity(c, item) for item in items] for c in coordinators]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept, warmup
+    return size
+
+def build_time(items, devices):
+    coordinators = [coordinator(1000 + i) for i in range(devices)]
+    start = time.perf_counter()
+    kept = [[entity.SolarmanEntity(c, item) for item in items] for c in coordinators]
+    elapsed = time.perf_counter() - start
+    del kept
+    return elapsed
+
+def run(file, devices, disabled):
+    items = profile_.load_profile(file, ATTR)["items"]
+    size = measure(items, devices)
+    print(f"{os.path.basename(file)}: {len(items)} items x {devices} devices, entities: {size / 1024:.1f}KiB, {size / len(items) / devices:.0f}B per entity, built in {build_time(items, devices) * 1000:.1f}ms")
+    # Every n-th remaining item stands in for the ones disabled in the registry
+    step = round(100 / disabled) if disabled else 0
+    enabled = [i for n, i in enumerate(i for i in items if not "disabled" in i) if not step or n % step]
+    if len(enabled) < len(items):
+        size = measure(enabled, devices)
+        print(f"  {len(items) - len(enabled)} disabled ({sum('disabled' in i for i in items)} by the profile) not built: {size / 1024:.1f}KiB, built in {build_time(enabled, devices) * 1000:.1f}ms")
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print("File not provided!")
+        sys.exit()
+
+    file = sys.argv[1]
+
+    if not os.path.exists(file):
+        print("File does not exist!")
+        sys.exit()
+
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isnumeric() else 10
+    disabled = int(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3].isnumeric() else 0
+
+    for f in sorted(os.path.join(file, f) for f in os.listdir(file) if f.endswith(".yaml")) if os.path.isdir(file) else [file]:
+        run(f, devices, disabled)
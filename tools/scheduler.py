@@ -1,14 +1,29 @@
 #
-# Command: py scheduler.py {path} {span} {runtime}
-# Example: py scheduler.py "..\custom_components\solarman\inverter_definitions\deye_sg04lp3.yaml" 25 0
+# Command: py scheduler.py {path} {span} {runtime} {latency}
+# Example: py scheduler.py "..\custom_components\solarman\inverter_definitions\deye_sg04lp3.yaml" 25 0 150,1.5
 # span:    Min span between registers to assume single request
 # runtime: Runtime mod update_interval
+# latency: Simulated request overhead and per register cost in ms, feeds the integration's RequestTimings and compares the fixed span with the plan it learns
+#
+# Command: py scheduler.py {path} plan
+# Example: py scheduler.py "..\custom_components\heatcontrol\inverter_definitions" plan
+# path:    Profile or directory of profiles
+#
+# Reports the poll plan of every mod/mppt/phase/pack combination the profile distinguishes
+# and the full cycle of request sets over the LCM of its update intervals, the integration plans on the first load and caches the plans
+# Requires the Home Assistant development environment (the integration modules are imported directly)
 #
 
 import os
 import sys
+import copy
+import math
 import yaml
+import types
 import bisect
+import random
+import itertools
+import importlib
 
 from typing import Any
 
@@ -77,6 +92,71 @@ def group_when(iterable, predicate):
         i += 1
     yield iterable[x:size]
 
+def plan(registers, span, max_size, is_single_code):
+    l = (lambda x, y: y - x > span) if span > -1 else (lambda x, y: False)
+
+    _lambda = lambda x, y, z: l(x[1], y[1]) or y[1] - z[1] >= max_size
+    _lambda_code_aware = lambda x, y, z: x[0] != y[0] or _lambda(x, y, z)
+
+    return [r for r in group_when(registers, _lambda if is_single_code or all_same([r[0] for r in registers]) else _lambda_code_aware) if len(r) > 0]
+
+def poll_time(requests, overhead, per_register):
+    return sum(overhead + per_register * (r["end"] - r["start"] + 1) for r in requests)
+
+def load(module):
+    if not "heatcontrol" in sys.modules:
+        package = types.ModuleType("heatcontrol")
+        package.__path__ = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components", "heatcontrol")]
+        sys.modules["heatcontrol"] = package
+    return importlib.import_module(f"heatcontrol.{module}")
+
+# V5 frame sizes: header, payload prefix, Modbus RTU frame and trailer
+V5_REQUEST_BYTES = 11 + 15 + 8 + 2
+V5_RESPONSE_BYTES = 11 + 14 + 5 + 2
+
+def cycle(scheduler_, schedule, tick):
+    # Replays the runtime scheduler over one full cycle and collects the distinct request sets
+    length = math.lcm(*(max(int(i), tick) for i in schedule)) if schedule else tick
+    scheduler = scheduler_.Scheduler(schedule, tick, 0)
+    return length, [tuple((r["code"], r["start"], r["end"]) for r in scheduler_.Scheduler.requests(scheduler.due(t))) for t in range(0, length, tick)]
+
+def thresholds_of(profile_, raw):
+    # Item filters compare attributes against these values only, attributes between two thresholds result in the same plan
+    items = [profile_.process_descriptions(item, group, {}, 0x03, 0) for group in copy.deepcopy(raw["parameters"]) for item in group["items"]]
+    return {k: sorted({i[k] for i in items if k in i}) for k in sorted(profile_.ATTR_.values())}
+
+def key_of(thresholds, attr):
+    return ','.join(f"{k}={max((t for t in v if attr.get(k) is not None and t <= attr[k]), default = None)}" for k, v in thresholds.items() if v)
+
+def report(file):
+    profile_, scheduler_ = load("profile"), load("scheduler")
+
+    with open(file) as f:
+        raw = yaml.safe_load(f)
+
+    thresholds = thresholds_of(profile_, raw)
+    keys = [k for k, v in thresholds.items() if v]
+    plans, schedules = {}, []
+
+    for values in itertools.product(*([min(thresholds[k]) - 1] + thresholds[k] for k in keys)):
+        attr = {"mod": 0, "mppt": 12, "l": 3, "pack": 8} | dict(zip(keys, values))
+        profile = profile_.compile_profile(copy.deepcopy(raw), attr)
+        plan = [{str(k): list(v) for k, v in profile["schedule"].items()}, list(profile["realtime"])]
+        if not plan in schedules:
+            schedules.append(plan)
+        plans[key_of(thresholds, attr)] = schedules.index(plan)
+
+    realtime_interval = raw.get("default", {}).get("realtime_interval", profile_.TIMINGS_REALTIME_INTERVAL)
+    print(f"{os.path.basename(file)}: {len(plans)} combinations, {len(schedules)} distinct plans")
+
+    for n, (schedule, realtime) in enumerate(schedules):
+        length, sets = cycle(scheduler_, {int(k): v for k, v in schedule.items()}, profile_.TIMINGS_INTERVAL)
+        requests = [r for s in sets for r in s]
+        hours = length / 3600
+        per_hour = (len(requests) + len(realtime) * length / realtime_interval) / hours
+        bytes_per_hour = (sum(V5_REQUEST_BYTES + V5_RESPONSE_BYTES + 2 * (r[2] - r[1] + 1) for r in requests) + length / realtime_interval * sum(V5_REQUEST_BYTES + V5_RESPONSE_BYTES + 2 * (r["end"] - r["start"] + 1) for r in realtime)) / hours
+        print(f"  plan {n} ({sum(1 for i in plans.values() if i == n)} combinations): cycle {length}s, {len(set(s for s in sets if s))} distinct request sets, {per_hour:.0f} requests/h, {bytes_per_hour / 1024:.1f}KiB/h")
+
 if __name__ == '__main__':
 
     if len(sys.argv) < 2:
@@ -85,6 +165,11 @@ if __name__ == '__main__':
 
     file = sys.argv[1]
 
+    if len(sys.argv) > 2 and sys.argv[2] == "plan" and os.path.exists(file):
+        for f in sorted(os.path.join(file, f) for f in os.listdir(file) if f.endswith(".yaml")) if os.path.isdir(file) else [file]:
+            report(f)
+        sys.exit()
+
     if not os.path.isfile(file):
         print("File does not exist!")
         sys.exit()
@@ -126,22 +211,30 @@ if __name__ == '__main__':
                         if (register := (get_code(i, "read"), r)) and not register in registers:
                             bisect.insort(registers, register)
 
-    l = (lambda x, y: y - x > span) if span > -1 else (lambda x, y: False)
-
-    _lambda = lambda x, y, z: l(x[1], y[1]) or y[1] - z[1] >= _max_size
-    _lambda_code_aware = lambda x, y, z: x[0] != y[0] or _lambda(x, y, z)
-
-    groups = group_when(registers, _lambda if _is_single_code or all_same([r[0] for r in registers]) else _lambda_code_aware)
+    groups = plan(registers, span, _max_size, _is_single_code)
 
     msg = ''
 
     for r in groups:
-        if len(r) > 0:
-            start = r[0][1]
-            end = r[-1][1]
-            dict = { "code": _code if _is_single_code else r[0][0], "start": start, "end": end, "len": end - start + 1 }
-            msg += f'{dict}\n'
+        start = r[0][1]
+        end = r[-1][1]
+        dict = { "code": _code if _is_single_code else r[0][0], "start": start, "end": end, "len": end - start + 1 }
+        msg += f'{dict}\n'
 
     print("")
 
-    print(msg)
\ No newline at end of file
+    print(msg)
+
+    if len(sys.argv) > 4 and len(latency := sys.argv[4].split(',')) == 2:
+        overhead, per_register = float(latency[0]), float(latency[1])
+        fixed = [{ "start": r[0][1], "end": r[-1][1] } for r in groups]
+
+        # Feed the integration's RequestTimings with a few polls of jittered round-trips of the current requests and some probing sizes
+        timings = load("timings").RequestTimings()
+        for s in [r["end"] - r["start"] + 1 for r in fixed] * 10 + [1, _max_size // 2, _max_size] * 10:
+            timings.record(s, max(overhead + per_register * s + random.gauss(0, overhead / 10), 0))
+        o, p = timings.model()
+        adaptive = timings.group(registers, _code if _is_single_code else None, span, _max_size)
+
+        print(f"Fixed span {span}: {len(fixed)} requests, {poll_time(fixed, overhead, per_register):.1f}ms per poll")
+        print(f"Learned (overhead {o:.1f}ms, {p:.3f}ms per register): {len(adaptive)} requests, {poll_time(adaptive, overhead, per_register):.1f}ms per poll")
@@ -0,0 +1,148 @@
+#
+# Command: py simulator.py {path} {serials} {latency} {jitter} {drop}
+# Example: py simulator.py "..\custom_components\heatcontrol\inverter_definitions\deye_p3.yaml" 1234567890,1234567891 0.05 0.02 0.01
+# serials: Comma separated logger serials, each one is served on its own port starting with 8899
+# latency: Response delay in seconds
+# jitter:  Random delay added to the latency in seconds
+# drop:    Probability of a request frame being dropped without response
+#
+
+import os
+import sys
+import yaml
+import struct
+import random
+import asyncio
+
+PORT = 8899
+
+V5_START = 0xA5
+V5_END = 0x15
+V5_CONTROL_REQUEST = 0x4510
+V5_CONTROL_RESPONSE = 0x1510
+
+def crc16(data):
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+def rtu_frame(data):
+    return data + struct.pack("<H", crc16(data))
+
+def v5_encode(serial, sequence, control, payload):
+    frame = struct.pack("<BHHHI", V5_START, len(payload), control, sequence, serial) + payload
+    return frame + bytes([sum(frame[1:]) & 0xFF, V5_END])
+
+def image(profile):
+    registers = {}
+    code = profile.get("default", {}).get("code", 0x03)
+    for group in profile["parameters"]:
+        for item in group["items"]:
+            c = item.get("code", code)
+            c = c if isinstance(c, int) else c.get("read", code)
+            for r in item.get("registers", []):
+                registers.setdefault(0x03 if c == 0x10 else c, {})[r] = random.randint(0, 0x7FFF) if item.get("rule") in (1, 2, 3, 4) else random.randint(0x3030, 0x7A7A)
+    return registers
+
+class Logger:
+    def __init__(self, serial, registers, latency, jitter, drop):
+        self.serial = serial
+        self.registers = registers
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.requests = 0
+        self.dropped = 0
+
+    def execute(self, frame):
+        slave, code, address = struct.unpack(">BBH", frame[:4])
+        if crc16(frame[:-2]) != struct.unpack("<H", frame[-2:])[0]:
+            return None
+        if code in (0x03, 0x04):
+            count = struct.unpack(">H", frame[4:6])[0]
+            table = self.registers.get(code, {})
+            return rtu_frame(struct.pack(f">BBB{count}H", slave, code, 2 * count, *(table.get(r, 0) for r in range(address, address + count))))
+        if code == 0x06:
+            self.registers.setdefault(0x03, {})[address] = struct.unpack(">H", frame[4:6])[0]
+            return rtu_frame(frame[:6])
+        if code == 0x10:
+            count = struct.unpack(">H", frame[4:6])[0]
+            for i, v in enumerate(struct.unpack(f">{count}H", frame[7:7 + 2 * count])):
+                self.registers.setdefault(0x03, {})[address + i] = v
+            return rtu_frame(frame[:6])
+        return rtu_frame(struct.pack(">BBB", slave, code | 0x80, 0x01))
+
+    async def respond(self, writer, sequence, frame):
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if (response := self.execute(frame)) is not None and not writer.is_closing():
+            writer.write(v5_encode(self.serial, sequence, V5_CONTROL_RESPONSE, bytes([0x02, 0x01]) + bytes(12) + response))
+
+    async def handle(self, reader, writer):
+        # Requests are answered in order like a real logger forwarding them to a single RS485 bus
+        queue = asyncio.Queue()
+
+        async def worker():
+            while True:
+                await self.respond(writer, *await queue.get())
+
+        task = asyncio.create_task(worker())
+        try:
+            while True:
+                header = await reader.readexactly(11)
+                if header[0] != V5_START:
+                    break
+                frame = header + await reader.readexactly(int.from_bytes(header[1:3], "little") + 2)
+                _, _, control, sequence, serial = struct.unpack("<BHHHI", frame[:11])
+                self.requests += 1
+                if control != V5_CONTROL_REQUEST or serial != self.serial or random.random() < self.drop:
+                    self.dropped += 1
+                    continue
+                queue.put_nowait((sequence, frame[11 + 15:-2]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            task.cancel()
+            writer.close()
+
+async def serve(file, serials, latency = 0, jitter = 0, drop = 0, host = "0.0.0.0", port = PORT):
+    with open(file) as f:
+        profile = yaml.safe_load(f)
+
+    loggers, servers = [], []
+
+    for n, serial in enumerate(serials):
+        logger = Logger(serial, image(profile), latency, jitter, drop)
+        servers.append(await asyncio.start_server(logger.handle, host, port + n))
+        loggers.append(logger)
+        print(f"Simulating {os.path.basename(file)} as {serial} on {host}:{port + n}")
+
+    return loggers, servers
+
+async def main():
+    serials = [int(s) for s in sys.argv[2].split(',')] if len(sys.argv) > 2 else [1234567890]
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    jitter = float(sys.argv[4]) if len(sys.argv) > 4 else 0.02
+    drop = float(sys.argv[5]) if len(sys.argv) > 5 else 0
+
+    _, servers = await serve(sys.argv[1], serials, latency, jitter, drop)
+
+    try:
+        await asyncio.gather(*(s.serve_forever() for s in servers))
+    finally:
+        for s in servers:
+            s.close()
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print("File not provided!")
+        sys.exit()
+
+    if not os.path.isfile(sys.argv[1]):
+        print("File does not exist!")
+        sys.exit()
+
+    asyncio.run(main())